@@ -1,9 +1,9 @@
 import streamlit as st
-from core.pipeline.pipeline import RAGPipeline
-from core.vector_store.history import History
+from core.registry import get_pipeline, get_history, start_warmup, warmup_status
 import uuid
 from core.setup import Setup
 from core.vector_store.logger import ActivityLogger
+from core.types import GENERATION_FAILED_ERROR
 import traceback
 
 st.title("Bonjour !")
@@ -30,13 +30,20 @@ with st.sidebar:
         st.success("Configuré", icon="✅")
         activity_logger = ActivityLogger(source="chatbot")
 
+    # models and agents load in the background while the page is already usable
+    start_warmup()
+    warmup = warmup_status()
+    if warmup["state"] == "running":
+        st.info("Chargement des modèles...", icon="⏳")
+    elif warmup["state"] == "error":
+        st.warning(f"Préchargement des modèles échoué : {warmup['error']}", icon="⚠️")
+
     if st.button("+ Nouvelle conversation"):
         try:
             activity_logger.log_interaction("New conversation started", "info")
+            # the pipeline is shared, a new conversation only resets the session state
             st.session_state.messages = []
             st.session_state.current_conversation_id = None
-            if "pipeline" in st.session_state:
-                st.session_state.pipeline = RAGPipeline()
             st.rerun()
         except Exception as e:
             error_msg = f"Erreur lors de la création d'une nouvelle conversation: {str(e)}"
@@ -45,21 +52,22 @@ with st.sidebar:
                 f"New conversation error: {str(e)}\n{traceback.format_exc()}", "error")
 
 
-if "history" not in st.session_state:
-    try:
-        st.session_state.history = History()
-    except Exception as e:
-        error_msg = f"Erreur lors de l'initialisation de l'historique: {str(e)}"
-        st.error(error_msg)
-        activity_logger.log_interaction(
-            f"History initialization error: {str(e)}\n{traceback.format_exc()}", "error")
-        st.stop()
+# models, agents and clients are loaded once per process and shared by every session,
+# the session only keeps the messages and the current conversation id
+try:
+    history = get_history()
+except Exception as e:
+    error_msg = f"Erreur lors de l'initialisation de l'historique: {str(e)}"
+    st.error(error_msg)
+    activity_logger.log_interaction(
+        f"History initialization error: {str(e)}\n{traceback.format_exc()}", "error")
+    st.stop()
 
 if "current_conversation_id" not in st.session_state:
     st.session_state.current_conversation_id = None
 
 try:
-    my_history = st.session_state.history.list_history()
+    my_history = history.list_history()
 except Exception as e:
     error_msg = f"Erreur lors du chargement de l'historique: {str(e)}"
     st.sidebar.error(error_msg)
@@ -76,7 +84,7 @@ with st.sidebar:
                         f"Switched to conversation {conversation['id']}", "info")
                     st.session_state.messages = []
                     st.session_state.current_conversation_id = conversation["id"]
-                    st.session_state.messages = st.session_state.history.load_messages(
+                    st.session_state.messages = history.load_messages(
                         conversation["id"])  # type: ignore
                     st.rerun()
                 except Exception as e:
@@ -85,16 +93,6 @@ with st.sidebar:
                     activity_logger.log_interaction(
                         f"Conversation loading error: {str(e)}\n{traceback.format_exc()}", "error")
 
-if "pipeline" not in st.session_state:
-    try:
-        st.session_state.pipeline = RAGPipeline()
-    except Exception as e:
-        error_msg = f"Erreur lors de l'initialisation du pipeline RAG: {str(e)}"
-        st.error(error_msg)
-        activity_logger.log_interaction(
-            f"Pipeline initialization error: {str(e)}\n{traceback.format_exc()}", "error")
-        st.stop()
-
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -111,7 +109,7 @@ try:
                         cols = st.columns(len(documents))
                         for idx, doc in enumerate(documents):
                             with cols[idx]:
-                                doc_title = doc.source.get('doc_title', 'Document sans titre')
+                                doc_title = doc.title or 'Document sans titre'
                                 st.markdown(f"📄 - {doc_title}")
                 except Exception as e:
                     activity_logger.log_interaction(f"Error displaying sources: {str(e)}", "error")
@@ -125,13 +123,23 @@ except Exception as e:
 if prompt := st.chat_input("Poser une question sur un document"):
     activity_logger.log_interaction(f"User asked a question: {prompt}", "info")
 
+    # only needed once a question is asked, waits for the warm-up if it is not finished
+    try:
+        pipeline = get_pipeline()
+    except Exception as e:
+        error_msg = f"Erreur lors de l'initialisation du pipeline RAG: {str(e)}"
+        st.error(error_msg)
+        activity_logger.log_interaction(
+            f"Pipeline initialization error: {str(e)}\n{traceback.format_exc()}", "error")
+        st.stop()
+
     try:
         # Gestion de la création de conversation
         if st.session_state.current_conversation_id is None:
             new_conversation_id = str(uuid.uuid4())
             st.session_state.current_conversation_id = new_conversation_id
             try:
-                st.session_state.history.create_conversation(new_conversation_id, message=prompt)
+                history.create_conversation(new_conversation_id, message=prompt)
             except Exception as e:
                 error_msg = f"Erreur lors de la création de la conversation: {str(e)}"
                 st.error(error_msg)
@@ -141,7 +149,7 @@ if prompt := st.chat_input("Poser une question sur un document"):
 
         # Ajout du message utilisateur à l'historique
         try:
-            st.session_state.history.add_message(
+            history.add_message(
                 conversation_id=st.session_state.current_conversation_id,
                 role="user",
                 message=prompt
@@ -162,10 +170,32 @@ if prompt := st.chat_input("Poser une question sur un document"):
                     status_placeholder.text(message)
 
             try:
-                response = st.session_state.pipeline.process_query(
-                    prompt, status_callback=status_callback)
+                # tokens are rendered as they arrive, the final event carries sources or error
+                final = {}
+
+                def stream_tokens():
+                    for event in pipeline.stream_query(
+                            prompt, status_callback=status_callback,
+                            conversation_id=st.session_state.current_conversation_id):
+                        if event.type == "token":
+                            if "first_token" not in final:
+                                final["first_token"] = True
+                                status.update(
+                                    label="Traitement terminé ✓",
+                                    state="complete",
+                                    expanded=False
+                                )
+                            yield event.token
+                        else:
+                            final["response"] = event.response
+
+                answer_placeholder = st.empty()
+                with answer_placeholder:
+                    st.write_stream(stream_tokens())
+                response = final["response"]
 
                 if response.error:
+                    answer_placeholder.empty()
                     activity_logger.log_interaction(
                         f"Error during processing: {response.details}",
                         "info")  # this is not really an error just a guardrail response
@@ -177,15 +207,17 @@ if prompt := st.chat_input("Poser une question sur un document"):
                     error_text = f"Details: {response.details}"
                     st.markdown(error_text)
 
-                    try:
-                        st.session_state.history.add_message(
-                            conversation_id=st.session_state.current_conversation_id,
-                            role="assistant",
-                            message=error_text
-                        )
-                    except Exception as e:
-                        activity_logger.log_interaction(
-                            f"Error saving error message to history: {str(e)}", "error")
+                    # a generation that broke off is not an answer of the conversation
+                    if response.error != GENERATION_FAILED_ERROR:
+                        try:
+                            history.add_message(
+                                conversation_id=st.session_state.current_conversation_id,
+                                role="assistant",
+                                message=error_text
+                            )
+                        except Exception as e:
+                            activity_logger.log_interaction(
+                                f"Error saving error message to history: {str(e)}", "error")
 
                     st.session_state.messages.append({
                         "role": "assistant",
@@ -198,10 +230,9 @@ if prompt := st.chat_input("Poser une question sur un document"):
                         state="complete",
                         expanded=False
                     )
-                    st.markdown(response.answer)
 
                     try:
-                        st.session_state.history.add_message(
+                        history.add_message(
                             conversation_id=st.session_state.current_conversation_id,
                             role="assistant",
                             message=response.answer
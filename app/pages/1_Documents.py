@@ -39,7 +39,8 @@ try:
     if index_exists:
         st.success("✅ Index connecté")
         try:
-            documents = st.session_state.doc_manager.es_client.list_documents(index_name)
+            documents = st.session_state.doc_manager.es_client.list_documents(
+                index_name, collapse_field="metadata.source", size=1000)
             st.metric("Nombre de documents", len(documents))
         except Exception as e:
             st.error(f"Erreur lors du chargement des documents: {str(e)}")
@@ -59,7 +60,8 @@ with tab1:
 
     if index_exists:
         try:
-            documents = st.session_state.doc_manager.es_client.list_documents(index_name)
+            documents = st.session_state.doc_manager.es_client.list_documents(
+                index_name, collapse_field="metadata.source", size=1000)
 
             if documents:
                 doc_data = []
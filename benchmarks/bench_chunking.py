@@ -0,0 +1,63 @@
+# Chunking benchmark: python -m benchmarks.bench_chunking --size-mb 5
+# Builds a synthetic corpus from data/raw, chunks it and reports chunks/sec, peak memory
+# and the estimated index size per corpus MB (chunk _source + float32 vector).
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from core.preprocessing import Preprocessor
+from core.vector_store.mappings import embeddings_dimension
+
+
+def build_corpus(raw_folder: str, target_folder: str, size_mb: float) -> int:
+    samples = []
+    for fname in sorted(os.listdir(raw_folder)):
+        if fname.endswith('.txt'):
+            with open(os.path.join(raw_folder, fname), 'r', encoding='utf-8') as f:
+                samples.append(f.read())
+    target = int(size_mb * 1024 * 1024)
+    written = 0
+    with open(os.path.join(target_folder, "corpus.txt"), 'w', encoding='utf-8') as f:
+        while written < target:
+            for sample in samples:
+                f.write(sample + "\n\n")
+                written += len(sample.encode('utf-8')) + 2
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-folder", default="data/raw")
+    parser.add_argument("--size-mb", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_bytes = build_corpus(args.raw_folder, tmp, args.size_mb)
+        preprocessor = Preprocessor(raw_path=tmp, clean_path=tmp)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        clean_file = preprocessor.process_file(os.path.join(tmp, "corpus.txt"))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        nb_chunks = 0
+        source_bytes = 0
+        with open(clean_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                nb_chunks += 1
+                source_bytes += len(json.dumps(json.loads(line)).encode('utf-8'))
+
+    corpus_mb = corpus_bytes / (1024 * 1024)
+    index_bytes = source_bytes + nb_chunks * embeddings_dimension * 4
+    print(f"corpus: {corpus_mb:.1f} MB, chunks: {nb_chunks}")
+    print(f"chunking: {nb_chunks / elapsed:.0f} chunks/sec ({corpus_mb / elapsed:.2f} MB/sec)")
+    print(f"peak python memory: {peak / (1024 * 1024):.1f} MB")
+    print(f"estimated index size: {index_bytes / (1024 * 1024) / corpus_mb:.2f} MB per corpus MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Embedder backend benchmark: python -m benchmarks.bench_embedder_backends [--backends torch onnx-int8]
+# Encodes the chunks of the .txt files of data/raw with every backend and reports encodes/sec
+# (batched like the ingestion, and one by one like the queries). Parity: the cosine similarity
+# of each vector with the fp32 torch vector of the same text must stay above 1 - --max-drift,
+# the exit code is 1 when a backend drifts more.
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from core.chunking import Chunker
+from core.config import EMBEDDINGS_MODEL_NAME, EMBEDDINGS_MAX_DRIFT
+from core.model_backends import BACKENDS, load_embedding_model
+
+
+def load_chunks(raw_folder: str, max_chunks: int):
+    chunker = Chunker()
+    chunks = []
+    for fname in sorted(os.listdir(raw_folder)):
+        if fname.endswith('.txt'):
+            with open(os.path.join(raw_folder, fname), 'r', encoding='utf-8') as f:
+                chunks.extend(chunk["content"] for chunk in chunker.chunk_blocks([f.read()]))
+    # repeated up to the requested size, the model does not cache anything
+    while chunks and len(chunks) < max_chunks:
+        chunks.extend(chunks[:max_chunks - len(chunks)])
+    return chunks[:max_chunks]
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-folder", default="data/raw")
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=50, help="texts encoded one by one")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--max-drift", type=float, default=EMBEDDINGS_MAX_DRIFT, help="max 1 - cosine against fp32")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.raw_folder, args.chunks)
+    if not chunks:
+        sys.exit(f"no .txt file to chunk in {args.raw_folder}")
+    print(f"{len(chunks)} chunks, batch size {args.batch_size}, threads {args.threads or 'default'}")
+
+    reference = None
+    failed = False
+    for backend in ["torch"] + [backend for backend in args.backends if backend != "torch"]:
+        start = time.perf_counter()
+        model = load_embedding_model(EMBEDDINGS_MODEL_NAME, backend, args.threads)
+        load_seconds = time.perf_counter() - start
+        model.encode(chunks[:args.batch_size], batch_size=args.batch_size)  # warm-up
+
+        start = time.perf_counter()
+        vectors = normalise(model.encode(chunks, batch_size=args.batch_size))
+        batch_rate = len(chunks) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for text in chunks[:args.queries]:
+            model.encode([text])
+        query_ms = 1000 * (time.perf_counter() - start) / min(args.queries, len(chunks))
+
+        line = (f"{backend:>10}: load {load_seconds:5.1f} s, {batch_rate:7.1f} encodes/s batched, "
+                f"{query_ms:6.1f} ms/query")
+        if reference is None:
+            reference = vectors
+        else:
+            cosines = np.sum(vectors * reference, axis=1)
+            drift = 1 - float(cosines.min())
+            failed |= drift > args.max_drift
+            line += (f", cosine vs fp32 mean {cosines.mean():.4f} min {cosines.min():.4f}"
+                     f"{' FAILED' if drift > args.max_drift else ''}")
+        print(line)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# kNN recall benchmark (needs a running Elasticsearch with an indexed corpus):
+# python -m benchmarks.bench_knn_recall --queries 50 --k 5
+# Sample chunks of the index are used as queries, the exact script_score results are the
+# reference for the recall@k and latency of the HNSW knn search at several num_candidates.
+import argparse
+import time
+from core.config import DOCUMENTS_INDEX_NAME
+from core.embeddings import Embedder
+from core.vector_store.elastic_client import ElasticClient
+
+
+def sample_queries(es_client: ElasticClient, nb_queries: int):
+    response = es_client.es.search(
+        index=DOCUMENTS_INDEX_NAME,
+        query={"function_score": {"random_score": {"seed": 42, "field": "_seq_no"}}},
+        source_includes=["content"],
+        size=nb_queries)
+    # the first sentence of a chunk looks like a short question on it
+    return [hit["_source"]["content"].split(". ")[0] for hit in response["hits"]["hits"]]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[10, 50, 100, 200])
+    args = parser.parse_args()
+
+    es_client = ElasticClient()
+    embedder = Embedder()
+    queries = sample_queries(es_client, args.queries)
+    vectors = embedder.embed_multiple_texts(queries).vectors
+
+    exact_ids, exact_time = [], 0.0
+    for vector in vectors:
+        hits, elapsed = timed(es_client.cosine_similarity_search,
+                              DOCUMENTS_INDEX_NAME, vector.tolist(), top_k=args.k)
+        exact_ids.append({hit["_id"] for hit in hits})
+        exact_time += elapsed
+    print(f"exact: {1000 * exact_time / len(queries):.1f} ms/query")
+
+    for num_candidates in args.num_candidates:
+        recall, knn_time = 0.0, 0.0
+        for vector, reference in zip(vectors, exact_ids):
+            hits, elapsed = timed(es_client.knn_search, DOCUMENTS_INDEX_NAME, vector.tolist(),
+                                  top_k=args.k, num_candidates=max(num_candidates, args.k))
+            knn_time += elapsed
+            if reference:
+                recall += len({hit["_id"] for hit in hits} & reference) / len(reference)
+        print(f"knn num_candidates={num_candidates}: recall@{args.k} {recall / len(queries):.3f}, "
+              f"{1000 * knn_time / len(queries):.1f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
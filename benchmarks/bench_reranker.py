@@ -0,0 +1,81 @@
+# Reranker benchmark: python -m benchmarks.bench_reranker [--backends torch torch-int8] [--threads 4]
+# Reports the rerank latency against the number of candidates and the document length (in words,
+# documents built from the .txt files of data/raw) for each backend, with the length-sorted
+# micro-batches and with one batch padded to the longest pair like before. Mixed lengths are the
+# case where the micro-batches save the most padding.
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from core.config import RERANKER_MODEL_NAME, RERANKER_BATCH_SIZE
+from core.model_backends import BACKENDS
+from core.pipeline.reranker import Reranker
+from core.types import ElasticsearchAnswer, ElasticsearchAnswerItem
+
+QUERY = "Quelles sont les conditions de résiliation du contrat en cas d'impayé ?"
+
+
+def load_words(raw_folder: str):
+    words = []
+    for fname in sorted(os.listdir(raw_folder)):
+        if fname.endswith('.txt'):
+            with open(os.path.join(raw_folder, fname), 'r', encoding='utf-8') as f:
+                words.extend(f.read().split())
+    return words
+
+
+def make_hits(words, candidates: int, lengths):
+    hits = []
+    for i in range(candidates):
+        length = lengths[i % len(lengths)]
+        start = (i * 37) % max(1, len(words) - length)
+        content = " ".join((words * (1 + length // len(words)))[start:start + length])
+        hits.append(ElasticsearchAnswerItem(index="bench", id=str(i), score=1.0, title=f"doc {i}", content=content))
+    return ElasticsearchAnswer(hits=hits)
+
+
+def latency_ms(reranker: Reranker, hits: ElasticsearchAnswer, repeats: int) -> float:
+    # the RERANKER prints of every call are hidden
+    with contextlib.redirect_stdout(io.StringIO()):
+        reranker.rerank(QUERY, hits, top_n=2)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            reranker.rerank(QUERY, hits, top_n=2)
+        return 1000 * (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--raw-folder", default="data/raw")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8"], choices=BACKENDS)
+    parser.add_argument("--candidates", nargs="+", type=int, default=[4, 8, 16, 32])
+    parser.add_argument("--lengths", nargs="+", default=["50", "150", "400", "mixed"],
+                        help="words per document, 'mixed' cycles through 30, 80, 150 and 400")
+    parser.add_argument("--batch-size", type=int, default=RERANKER_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    words = load_words(args.raw_folder)
+    if not words:
+        sys.exit(f"no .txt file in {args.raw_folder}")
+
+    print(f"{RERANKER_MODEL_NAME}, micro-batches of {args.batch_size}, threads {args.threads or 'default'}")
+    for backend in args.backends:
+        reranker = Reranker(RERANKER_MODEL_NAME, backend, num_threads=args.threads, batch_size=args.batch_size)
+        for length in args.lengths:
+            lengths = [30, 80, 150, 400] if length == "mixed" else [int(length)]
+            for candidates in args.candidates:
+                hits = make_hits(words, candidates, lengths)
+                reranker.batch_size = args.batch_size
+                sorted_ms = latency_ms(reranker, hits, args.repeats)
+                reranker.batch_size = candidates  # one batch padded to the longest pair
+                single_ms = latency_ms(reranker, hits, args.repeats)
+                print(f"{backend:>10} | {length:>5} words | {candidates:3d} candidates | "
+                      f"{sorted_ms:8.1f} ms micro-batches | {single_ms:8.1f} ms single batch")
+
+
+if __name__ == "__main__":
+    main()
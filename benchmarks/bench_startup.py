@@ -0,0 +1,66 @@
+# Startup benchmark: python -m benchmarks.bench_startup [--query "question"]
+# Measures the import time of the modules on the page startup path (each one in a fresh
+# interpreter, so nothing is already imported), then the model loading and warm-up times.
+# With --query the first query is sent after the warm-up and its stage timings are printed
+# (logged by the pipeline, needs Elasticsearch and the OpenAI key).
+import argparse
+import subprocess
+import sys
+import time
+
+STARTUP_MODULES = [
+    "core.config",
+    "core.registry",
+    "core.setup",
+    "core.vector_store.history",
+    "core.embeddings",
+    "core.pipeline.reranker",
+    "core.pipeline.pipeline",
+]
+
+
+def import_seconds(module: str) -> float:
+    code = (f"import time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start)")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--query", default=None, help="first query to send after the warm-up")
+    args = parser.parse_args()
+
+    print("import times (fresh interpreter):")
+    for module in STARTUP_MODULES:
+        try:
+            print(f"  {module}: {import_seconds(module):.2f} s")
+        except RuntimeError as e:
+            print(f"  {e}")
+
+    from core.registry import get_embedder, get_reranker, get_pipeline
+    embedder = get_embedder()
+    print(f"embedding model load: {timed(lambda: embedder.model):.2f} s")
+    print(f"embedder warm-up: {timed(embedder.warm_up):.2f} s")
+    print(f"reranker model load: {timed(get_reranker):.2f} s")
+    print(f"reranker warm-up: {timed(get_reranker().warm_up):.2f} s")
+    print(f"pipeline (agents, guard pre-filter): {timed(get_pipeline):.2f} s")
+
+    if args.query:
+        pipeline = get_pipeline()
+        start = time.perf_counter()
+        response = pipeline.process_query(args.query)
+        print(f"first query: {time.perf_counter() - start:.2f} s"
+              f"{' (error: ' + str(response.details) + ')' if response.error else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Vector serialisation benchmark: python -m benchmarks.bench_vectors --chunks 10000
+# Compares the pydantic List[float] path (tolist + Document + model_dump + json) with the
+# DocumentBatch path (float32 matrix + base64 encoding) used by bulk indexing.
+import argparse
+import datetime
+import json
+import time
+import tracemalloc
+import numpy as np
+from core.types import Document, DocumentBatch, DocumentMetadata
+from core.vector_store.elastic_client import ElasticClient
+from core.vector_store.mappings import embeddings_dimension
+
+
+def make_metadata() -> DocumentMetadata:
+    return DocumentMetadata(source="data/raw/bench.txt", date="2024", modified="2024-01-01",
+                            embedding_model="bench", embedding_date="2024-01-01",
+                            embedding_dimension=embeddings_dimension)
+
+
+def list_path(vectors: np.ndarray) -> int:
+    metadata = make_metadata()
+    # like the previous bulk path: all the documents of the batch, then their actions
+    documents = [Document(doc_title="bench", content="chunk", embeddings=vector.tolist(),
+                          metadata=metadata, indexed_at=datetime.datetime.now(),
+                          chunk_id=f"bench-{i}", chunk_index=i)
+                 for i, vector in enumerate(vectors)]
+    # it validated every document a second time before dumping it
+    for document in documents:
+        Document(**document.model_dump())
+    actions = [{"_source": document.model_dump()} for document in documents]
+    return sum(len(json.dumps(action, default=str)) for action in actions)
+
+
+def batch_path(vectors: np.ndarray) -> int:
+    size = 0
+    metadata = make_metadata().model_dump()
+    batch = DocumentBatch(
+        ids=[f"bench-{i}" for i in range(len(vectors))],
+        documents=[{"doc_title": "bench", "content": "chunk", "metadata": metadata,
+                    "indexed_at": datetime.datetime.now(), "chunk_id": f"bench-{i}",
+                    "chunk_index": i} for i in range(len(vectors))],
+        vectors=vectors)
+    for document, vector in zip(batch.documents, ElasticClient.encode_vectors(batch.vectors)):
+        size += len(json.dumps({**document, "embeddings": vector}, default=str))
+    return size
+
+
+def measure(name, function, vectors):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = function(vectors)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name}: {elapsed:.2f}s, peak {peak / (1024 * 1024):.1f} MB, payload {size / (1024 * 1024):.1f} MB")
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=10000)
+    args = parser.parse_args()
+    vectors = np.random.default_rng(0).standard_normal(
+        (args.chunks, embeddings_dimension)).astype(np.float32)
+
+    list_time, list_peak = measure("List[float] + pydantic", list_path, vectors)
+    batch_time, batch_peak = measure("float32 batch + base64", batch_path, vectors)
+    print(f"per {args.chunks} chunks: {list_time - batch_time:.2f}s and "
+          f"{(list_peak - batch_peak) / (1024 * 1024):.1f} MB peak allocation saved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel
+from core.config import (AGENT_CACHE_ENABLED, AGENT_CACHE_PATH, AGENT_CACHE_MEMORY_ENTRIES,
+                         AGENT_CACHE_MAX_ENTRIES, AGENT_CACHE_TTL_SECONDS, AGENT_CACHE_POLICY)
+
+ResponseType = TypeVar("ResponseType", bound=BaseModel)
+
+
+class AgentResponseCache:
+    # structured responses of the agents, keyed by a hash of (model, system prompt, temperature,
+    # response schema, input): an in-memory LRU in front of a sqlite store that survives restarts,
+    # both bounded, and the entries expire after ttl_seconds
+    def __init__(self,
+                 path: str = AGENT_CACHE_PATH,
+                 memory_entries: int = AGENT_CACHE_MEMORY_ENTRIES,
+                 max_entries: int = AGENT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = AGENT_CACHE_TTL_SECONDS):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # key -> (response, created_at)
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, agent TEXT NOT NULL, response TEXT NOT NULL, created_at REAL NOT NULL)")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(responses)")]
+        if "last_access" not in columns:  # stores created before the LRU pruning
+            self.connection.execute("ALTER TABLE responses ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        self.connection.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - ttl_seconds,))
+        self.size = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str,
+                 system_prompt: str,
+                 temperature: float,
+                 response_type: Type[BaseModel],
+                 text: str) -> str:
+        # the system prompt is hashed as a whole, editing it is a new prompt version
+        parts = [model_name, system_prompt, repr(temperature), response_type.__name__, text.strip()]
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, response_type: Type[ResponseType]) -> Optional[ResponseType]:
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and entry[1] >= now - self.ttl_seconds:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+            else:
+                row = self.connection.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl_seconds)).fetchone()
+                if row is None:
+                    self.memory.pop(key, None)
+                    self.misses += 1
+                    return None
+                entry = (row[0], row[1])
+                self._remember(key, entry)
+                self.disk_hits += 1
+            # the sqlite LRU order follows the hits of both layers
+            self.connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return response_type.model_validate_json(entry[0])
+
+    def put(self, key: str, agent_name: str, response: BaseModel):
+        serialized = response.model_dump_json()
+        now = time.time()
+        with self.lock:
+            self._remember(key, (serialized, now))
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, agent, response, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)", (key, agent_name, serialized, now, now))
+                self.size += 1  # upper bound, replaced keys are counted twice
+                if self.size > self.max_entries:
+                    self._prune(now)
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def _prune(self, now: float):
+        # expired entries first, then the least recently used ones above the cap
+        self.connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        deleted = self.connection.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+            "ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+        self.evictions += max(deleted, 0)
+        self.size = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _remember(self, key: str, entry: Tuple[str, float]):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def clear(self, agent_name: Optional[str] = None):
+        with self.lock:
+            self.memory.clear()
+            if agent_name:
+                self.connection.execute("DELETE FROM responses WHERE agent = ?", (agent_name,))
+            else:
+                self.connection.execute("DELETE FROM responses")
+            self.size = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self.memory),
+                "disk_entries": min(self.size, self.max_entries),
+                "evictions": self.evictions,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_agent_cache() -> AgentResponseCache:
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = AgentResponseCache()
+        return _shared_cache
+
+
+def agent_cache_for(agent_name: str, use_cache: Optional[bool] = None) -> Optional[AgentResponseCache]:
+    # use_cache overrides AGENT_CACHE_POLICY, e.g. to opt a high temperature agent in
+    if use_cache is None:
+        use_cache = AGENT_CACHE_POLICY.get(agent_name, False)
+    if not (AGENT_CACHE_ENABLED and use_cache):
+        return None
+    try:
+        return get_agent_cache()
+    except sqlite3.Error as e:
+        print(f"AGENT CACHE: store unavailable, {agent_name} agent runs without cache: {e}")
+        return None
+
+
+def cached_call(cache: Optional[AgentResponseCache],
+                key_parts: Tuple[str, str, float, str],
+                agent_name: str,
+                response_type: Type[ResponseType],
+                compute: Callable[[], Optional[ResponseType]]) -> Optional[ResponseType]:
+    # served from the cache when this exact input was already answered, key_parts is
+    # (model name, system prompt, temperature, input); compute returns None for an invalid
+    # response, which is not cached; a broken store only costs the LLM call
+    if cache is None:
+        return compute()
+    model_name, system_prompt, temperature, text = key_parts
+    key = cache.make_key(model_name, system_prompt, temperature, response_type, text)
+    try:
+        cached = cache.get(key, response_type)
+        if cached is not None:
+            return cached
+    except (sqlite3.Error, ValueError) as e:  # ValueError: entry not matching the response schema
+        print(f"AGENT CACHE: lookup failed for the {agent_name} agent: {e}")
+    response = compute()
+    if response is not None:
+        try:
+            cache.put(key, agent_name, response)
+        except sqlite3.Error as e:
+            print(f"AGENT CACHE: write failed for the {agent_name} agent: {e}")
+    return response
@@ -0,0 +1,180 @@
+import re
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from core.config import CHUNK_TOKENIZER_NAME, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# a unit ends after a sentence punctuation followed by spaces, or on a blank line (paragraph),
+# enumerations like "1. Objet" are not cut
+UNIT_BOUNDARY = re.compile(r'(?<=[.!?;])(?<!\b\d\.)\s+|\n\s*\n')
+# table rows (csv) are separated by blank lines only, a row is one unit
+ROW_BOUNDARY = re.compile(r'\n\s*\n')
+# rough token pattern used when the tokenizer can not be loaded
+FALLBACK_TOKEN = re.compile(r"\w+|[^\w\s]")
+# bumped when the same text and settings give other chunks or chunk ids, the files are indexed again
+CHUNKER_VERSION = 4
+# a unit without any boundary (minified html, one line csv...) is cut after this many characters
+MAX_UNIT_CHARS = 4000
+
+# (start_offset, end_offset, text, token_count)
+Unit = Tuple[int, int, str, int]
+
+
+class Chunker:
+    def __init__(
+            self,
+            max_tokens: int = CHUNK_MAX_TOKENS,
+            overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+            tokenizer_name: str = CHUNK_TOKENIZER_NAME,
+            count_tokens: Optional[Callable[[List[str]], List[int]]] = None):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be lower than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer_name = tokenizer_name
+        self._count_tokens = count_tokens
+        self._tokenizer = None
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        if self._count_tokens is not None:
+            return self._count_tokens(texts)
+        if self._tokenizer is None:
+            try:
+                # only the tokenizer is loaded, not the model, so this stays cheap in workers
+                from transformers import AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+            except Exception as e:
+                print(f"CHUNKER: Could not load tokenizer {self.tokenizer_name}, using regex count: {e}")
+                self._count_tokens = lambda batch: [len(FALLBACK_TOKEN.findall(t)) for t in batch]
+                return self._count_tokens(texts)
+        encoded = self._tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def chunk_blocks(self, blocks: Iterable[str], rows: bool = False) -> Iterator[Dict]:
+        # blocks are consecutive pieces of the same text (file read by blocks), only a
+        # sliding window of units is kept in memory; with rows=True the blocks hold rows separated
+        # by blank lines, a row is never cut (unless longer than a chunk) nor carried in part
+        window: deque = deque()
+        window_tokens = 0
+        fresh = False  # True when the window holds units that were not emitted yet
+        chunk_index = 0
+        for unit in self._split_units(blocks, ROW_BOUNDARY if rows else UNIT_BOUNDARY):
+            if window and window_tokens + unit[3] > self.max_tokens:
+                if fresh:
+                    yield self._make_chunk(chunk_index, window, window_tokens)
+                    chunk_index += 1
+                # the last tokens of the chunk start the next one, as much as fits with the unit
+                window, window_tokens = self._overlap(
+                    window, min(self.overlap_tokens, self.max_tokens - unit[3]), cut_units=not rows)
+            window.append(unit)
+            window_tokens += unit[3]
+            fresh = True
+        if window and fresh:
+            yield self._make_chunk(chunk_index, window, window_tokens)
+
+    def _overlap(self, window: deque, budget: int, cut_units: bool = True) -> Tuple[deque, int]:
+        # whole units from the end of the window, then the end of the unit that does not fit whole:
+        # a sentence longer than the overlap still shares its last words with the next chunk
+        tail: deque = deque()
+        tokens = 0
+        for unit in reversed(window):
+            if tokens + unit[3] <= budget:
+                tail.appendleft(unit)
+                tokens += unit[3]
+                continue
+            cut = self._unit_tail(unit, budget - tokens) if cut_units else None
+            if cut is not None:
+                tail.appendleft(cut)
+                tokens += cut[3]
+            break
+        return tail, tokens
+
+    def _unit_tail(self, unit: Unit, budget: int) -> Optional[Unit]:
+        # last words of the unit holding at most budget tokens, the start offset is interpolated
+        if budget <= 0:
+            return None
+        start, end, text, _ = unit
+        words = text.split(" ")
+        kept, kept_tokens = 0, 0
+        for tokens in reversed(self.count_tokens(words)):
+            if kept_tokens + tokens > budget:
+                break
+            kept += 1
+            kept_tokens += tokens
+        if not kept:
+            return None
+        content = " ".join(words[-kept:])
+        scale = (end - start) / max(len(text), 1)
+        return (end - int(len(content) * scale), end, content, kept_tokens)
+
+    def _make_chunk(self, chunk_index: int, window: deque, window_tokens: int) -> Dict:
+        return {
+            "chunk_index": chunk_index,
+            "start_offset": window[0][0],
+            "end_offset": window[-1][1],
+            "content": " ".join(unit[2] for unit in window),
+            "token_count": window_tokens
+        }
+
+    def _split_units(self, blocks: Iterable[str], boundary: re.Pattern = UNIT_BOUNDARY) -> Iterator[Unit]:
+        buffer = ""
+        offset = 0  # absolute offset of buffer[0] in the whole text
+        for block in blocks:
+            buffer += block
+            spans = []
+            last_end = 0
+            for match in boundary.finditer(buffer):
+                # a boundary touching the end of the buffer may continue in the next block
+                if match.end() == len(buffer):
+                    break
+                spans.append((last_end, match.start()))
+                last_end = match.end()
+            if len(buffer) - last_end > MAX_UNIT_CHARS:
+                spans.append((last_end, len(buffer)))
+                last_end = len(buffer)
+            yield from self._make_units(buffer, offset, spans)
+            buffer = buffer[last_end:]
+            offset += last_end
+        yield from self._make_units(buffer, offset, [(0, len(buffer))])
+
+    def _make_units(self, buffer: str, offset: int, spans: List[Tuple[int, int]]) -> Iterator[Unit]:
+        texts, positions = [], []
+        for start, end in spans:
+            raw = buffer[start:end]
+            text = " ".join(raw.split())
+            if not text:
+                continue
+            start += len(raw) - len(raw.lstrip())
+            end -= len(raw) - len(raw.rstrip())
+            texts.append(text)
+            positions.append((offset + start, offset + end))
+        for (start, end), text, tokens in zip(positions, texts, self.count_tokens(texts)):
+            if tokens <= self.max_tokens:
+                yield (start, end, text, tokens)
+            else:
+                yield from self._split_long_unit(start, end, text)
+
+    def _split_long_unit(self, start: int, end: int, text: str) -> Iterator[Unit]:
+        # sentence longer than a chunk: cut it on words, offsets are interpolated; the pieces leave
+        # room for the overlap carried from the previous piece
+        max_piece_tokens = self.max_tokens - self.overlap_tokens
+        words = text.split(" ")
+        word_tokens = self.count_tokens(words)
+        scale = (end - start) / max(len(text), 1)
+        piece: List[str] = []
+        piece_tokens = 0
+        position = 0
+        piece_start = 0
+        for word, tokens in zip(words, word_tokens):
+            if piece and piece_tokens + tokens > max_piece_tokens:
+                content = " ".join(piece)
+                yield (start + int(piece_start * scale),
+                       start + int((piece_start + len(content)) * scale), content, piece_tokens)
+                piece, piece_tokens, piece_start = [], 0, position
+            piece.append(word)
+            piece_tokens += tokens
+            position += len(word) + 1
+        if piece:
+            content = " ".join(piece)
+            yield (start + int(piece_start * scale), end, content, piece_tokens)
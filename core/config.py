@@ -7,9 +7,128 @@ GUARDRAILS_MODEL_NAME = "gpt-4.1"
 HYDE_MODEL_NAME = "gpt-4.1"
 GENERATOR_MODEL_NAME = "gpt-4.1"
 TITLE_MODEL_NAME = "gpt-4.1"
+PLANNER_MODEL_NAME = "gpt-4.1"
 RERANKER_MODEL_NAME = "antoinelouis/crossencoder-camembert-base-mmarcoFR"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DOCUMENTS_INDEX_NAME = "documents_index"
 HISTORY_INDEX_NAME = "history_index"
 MESSAGE_INDEX_NAME = "message_index"
 LOGGER_INDEX_NAME = "logger_index"
+
+# chunking, the embedding model truncates inputs after 128 tokens so chunks stay below it
+CHUNK_TOKENIZER_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+CHUNK_MAX_TOKENS = 128
+CHUNK_OVERLAP_TOKENS = 24
+READ_BLOCK_SIZE = 64 * 1024  # characters read at once from raw files
+INDEX_BATCH_SIZE = 64  # chunks embedded and indexed together
+CSV_CHUNK_ROWS = 10000  # rows read at once from csv files
+
+# folder ingestion pipeline: parsing processes -> batched encode -> parallel bulk writes
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+INGEST_QUEUE_SIZE = 8  # batches waiting between two stages
+INGEST_ENCODE_BATCH_SIZE = 256  # chunks encoded by one SentenceTransformer.encode call
+ES_BULK_THREADS = 4
+ES_BULK_CHUNK_SIZE = 500
+MANIFEST_FILE_NAME = "ingestion_manifest.json"  # stored in the clean folder
+
+# on-disk embedding cache shared by every Embedder of the process
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = "data/cache/embeddings.sqlite"
+EMBEDDING_CACHE_MAX_ENTRIES = 100000  # ~300 MB of float32 vectors of dimension 768
+
+# cpu inference of the embedding model: "torch" (fp32), "torch-int8" (dynamic quantization),
+# "onnx" or "onnx-int8" (onnxruntime, needs optimum[onnxruntime] and python -m core.model_backends)
+EMBEDDINGS_BACKEND = "torch"
+EMBEDDINGS_NUM_THREADS = 0  # intra-op threads, 0 keeps the torch / onnxruntime default
+MODEL_EXPORT_DIR = "data/cache/models"  # onnx exports, one folder per model
+ONNX_QUANTIZATION_CONFIG = "avx2"  # "avx2", "avx512", "avx512_vnni" or "arm64"
+# max 1 - cosine of a vector of the quantized backends against the fp32 torch one
+# (tests/test_embedder_backends.py and benchmarks/bench_embedder_backends.py)
+EMBEDDINGS_MAX_DRIFT = 0.02
+
+# cpu inference of the cross-encoder, same backends as the embedding model
+RERANKER_BACKEND = "torch"
+RERANKER_NUM_THREADS = 0  # intra-op threads, 0 keeps the default
+RERANKER_INTEROP_THREADS = 0  # torch inter-op threads, only settable before the first torch op
+RERANKER_BATCH_SIZE = 8  # pairs of similar length scored together, less padding than one batch
+RERANKER_MAX_LENGTH = 512  # tokens of query + document
+ES_VECTOR_ENCODING = "base64"  # "base64" (elasticsearch >= 9.1) or "list" of floats
+
+# retrieval: "knn" (approximate, HNSW graph), "exact" (script_score over every chunk) or "hybrid"
+RETRIEVAL_MODE = "hybrid"
+HNSW_INDEX_TYPE = "hnsw"  # "int8_hnsw" or "bbq_hnsw" trade some recall for memory
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 100
+KNN_NUM_CANDIDATES_FACTOR = 10  # num_candidates = factor * k
+
+# hybrid retrieval (RETRIEVAL_MODE = "hybrid"): BM25 on content/doc_title + knn
+HYBRID_FUSION = "rrf"  # "rrf" (reciprocal rank fusion) or "weighted" (sum of boosted scores)
+RRF_RANK_CONSTANT = 60
+RRF_RANK_WINDOW_SIZE = 20  # hits fetched from each ranking before the fusion
+HYBRID_BM25_WEIGHT = 0.1  # bm25 scores are not bounded, the knn similarity is in [0, 1]
+HYBRID_KNN_WEIGHT = 1.0
+
+# elasticsearch connection, one client (and connection pool) per process shared by every component
+ES_HOSTS = os.getenv("ES_HOSTS", "http://localhost:9200")
+ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", "25"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "10"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+ES_RETRY_ON_TIMEOUT = True
+
+# activity logs are queued and sent in bulk by a background thread
+LOGGER_QUEUE_SIZE = 10000
+LOGGER_FLUSH_SIZE = 200  # lines per bulk request
+LOGGER_FLUSH_INTERVAL = 2.0  # seconds, a partial batch is sent after this delay
+LOGGER_HIGH_WATERMARK = 0.8  # above this queue fill ratio only 1 info line out of LOGGER_SAMPLE_RATE is kept
+LOGGER_SAMPLE_RATE = 10
+
+# query pipeline: the stages run as a dependency graph on a thread pool
+# "agents": guard, rewriter and HyDE agents (3 LLM calls), "planner": one PlannerAgent call for the three,
+# "adaptive": agents, but rewrite and HyDE are skipped when retrieval with the raw question is confident
+PIPELINE_MODE = "agents"
+# threads of the stage graphs, one pool shared by every session; the stages mostly wait on LLM and
+# Elasticsearch calls. a query holds up to 3 threads, and the running stages of a cancelled graph
+# keep theirs until their call returns (at most the agent timeout): ~PIPELINE_MAX_WORKERS / 3
+# concurrent queries, the next ones queue
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "32"))
+PIPELINE_TOP_K = 4  # chunks retrieved per query (rewritten question and HyDE answer)
+PIPELINE_RERANK_TOP_N = 2
+
+# semantic answer cache: a question close enough to an already answered one gets the same RAGResponse,
+# only for questions asked with an empty conversation memory, and after the guardrail
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.95  # cosine similarity between the two questions
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+SEMANTIC_CACHE_TTL_SECONDS = 24 * 3600
+
+# cache of the structured agents responses (in-memory LRU + sqlite), keyed on model, prompt, temperature and input
+AGENT_CACHE_ENABLED = True
+AGENT_CACHE_PATH = "data/cache/agents.sqlite"
+AGENT_CACHE_MEMORY_ENTRIES = 2000
+AGENT_CACHE_MAX_ENTRIES = 50000  # rows of the sqlite store, the least recently used go first
+AGENT_CACHE_TTL_SECONDS = 30 * 24 * 3600
+# guard and rewriter answer the same input the same way, hyde and title are sampled at temperature 0.7
+AGENT_CACHE_POLICY = {"guard": True, "rewriter": True, "hyde": False, "title": False, "planner": False}
+
+# local guardrail pre-filter: margin = similarity to legal questions - similarity to off-domain ones,
+# questions between -REJECT_MARGIN and ACCEPT_MARGIN still go to GuardAgent
+GUARD_PREFILTER_ENABLED = True
+GUARD_PREFILTER_ACCEPT_MARGIN = 0.15
+GUARD_PREFILTER_REJECT_MARGIN = 0.15
+GUARD_PREFILTER_TOP_K = 3  # the score of a class is the mean of its top_k similarities
+# GuardAgent rejections kept as extra off-domain references; accepted questions are never learned,
+# a crafted question accepted once would let its variants skip the LLM injection check
+GUARD_PREFILTER_MAX_LEARNED = 500
+
+# adaptive mode: the raw question is retrieved first (knn, _score = (1 + cosine) / 2) and rewrite/HyDE
+# are skipped when the top score or the margin between the two first hits clears its threshold
+FAST_PATH_RETRIEVAL_MODE = "knn"
+FAST_PATH_MIN_SCORE = 0.8
+FAST_PATH_MIN_MARGIN = 0.05
+
+# QA agent memory, one thread per History conversation: the last messages are replayed as is and the
+# older ones are folded into a rolling summary once the window exceeds the token budget
+SUMMARY_MODEL_NAME = "gpt-4.1"
+CONVERSATION_WINDOW_MESSAGES = 10  # messages restored from the message index
+CONVERSATION_TOKEN_BUDGET = 1500  # estimated tokens of the replayed messages
+CONVERSATION_MAX_THREADS = 200  # conversations kept in process memory, least recently used evicted
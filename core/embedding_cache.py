@@ -0,0 +1,107 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, List
+import numpy as np
+from core.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+
+
+class EmbeddingCache:
+    # vectors are stored as raw float32 blobs in sqlite, keyed by (model name, normalised text)
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+        self.size = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0  # time spent encoding the misses, used to estimate the time saved
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        normalised = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{model_name}\x00{normalised}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self.lock:
+            # sqlite limits the number of variables of a query
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found])
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray], encode_seconds: float = 0.0):
+        if not vectors:
+            return
+        now = time.time()
+        with self.lock:
+            self.encode_seconds += encode_seconds
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                    [(key, np.ascontiguousarray(vector, dtype=np.float32).tobytes(), now)
+                     for key, vector in vectors.items()])
+                self.size += len(vectors)  # upper bound, replaced keys are counted twice
+                if self.size > self.max_entries:
+                    # LRU eviction of the least recently used entries above the cap
+                    self.connection.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings "
+                        "ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+                    self.size = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                self.connection.execute("COMMIT")
+            except Exception:
+                # an open transaction would make every later BEGIN fail
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            size = min(self.size, self.max_entries)
+            lookups = self.hits + self.misses
+            seconds_per_encode = self.encode_seconds / self.misses if self.misses else 0.0
+            return {
+                "entries": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "estimated_seconds_saved": self.hits * seconds_per_encode
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    # one cache per process so that every Embedder shares the same store and counters
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
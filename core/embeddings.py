@@ -1,20 +1,56 @@
-from core.config import EMBEDDINGS_MODEL_NAME
-from sentence_transformers import SentenceTransformer
-from typing import Dict, List
+from core.config import EMBEDDINGS_MODEL_NAME, EMBEDDING_CACHE_ENABLED, EMBEDDINGS_BACKEND, EMBEDDINGS_NUM_THREADS
+from typing import Dict, List, Optional
 import datetime
-from core.types import Embeddings
+import threading
+import time
+import numpy as np
+from core.types import Embeddings, EmbeddingsBatch, EmbeddingsMetadata
+from core.embedding_cache import EmbeddingCache, get_embedding_cache
+from core.model_backends import backend_signature, check_backend, load_embedding_model
 from core.vector_store.logger import ActivityLogger
 
 
 class Embedder:
-    def __init__(self, model_name: str = EMBEDDINGS_MODEL_NAME):
-        self.model = SentenceTransformer(model_name, device='cpu')
+    def __init__(self,
+                 model_name: str = EMBEDDINGS_MODEL_NAME,
+                 cache: Optional[EmbeddingCache] = None,
+                 backend: str = EMBEDDINGS_BACKEND,
+                 num_threads: int = EMBEDDINGS_NUM_THREADS):
+        check_backend(backend)
+        self.model_name = model_name
+        self.backend = backend
+        self.num_threads = num_threads
+        # the quantized backends drift slightly from fp32, their vectors are cached apart (one
+        # key per quantization config too, like the ingestion manifest)
+        self.cache_model_name = model_name if backend == "torch" else f"{model_name}@{backend_signature(backend)}"
+        self._model = None  # loaded at the first encode, see model
+        # shared by every session and by the ingestion (core/registry.py), the tokenizer of the
+        # model is not safe to call from several threads
+        self.model_lock = threading.RLock()
+        self.cache = cache if cache is not None else (
+            get_embedding_cache() if EMBEDDING_CACHE_ENABLED else None)
         self.activity_logger = ActivityLogger("embedder")
 
+    @property
+    def model(self):
+        # sentence_transformers (and torch) are only imported when a text has to be encoded,
+        # so that importing the app or checking the indices stays fast
+        if self._model is None:
+            with self.model_lock:
+                if self._model is None:
+                    self._model = load_embedding_model(self.model_name, self.backend, self.num_threads)
+        return self._model
+
+    def warm_up(self):
+        # loads the model and runs one encode outside of the cache, the first real query is then fast
+        model = self.model
+        with self.model_lock:
+            model.encode(["warm-up"], show_progress_bar=False)
+
     def embed_text(self, text: str) -> Embeddings:
         try:
             # This will be use for the retrieval part to embed the query
-            embeddings = self.model.encode(text, show_progress_bar=False)
+            embeddings = self._encode([text], show_progress_bar=False)[0]
             embeddings_doc = {
                 "text": text,
                 "embeddings": embeddings.tolist(),
@@ -29,21 +65,43 @@ class Embedder:
             self.activity_logger.log_interaction(f"Error embedding text: {e}", "error")
             raise e
 
-    def embed_multiple_texts(self, texts: List[str]) -> List[Dict]:
+    def embed_multiple_texts(self, texts: List[str], show_progress_bar: bool = True) -> EmbeddingsBatch:
+        # vectors stay in one float32 matrix, no python float is created per value; the progress
+        # bar is for ingestion, not for the few texts of a query
         try:
-            embeddings = self.model.encode(texts, show_progress_bar=True)
-            results = []
-            for i, text in enumerate(texts):
-                results.append({
-                    "text": text,
-                    "embeddings": embeddings[i].tolist(),
-                    "metadata": {
-                        "embedding_model": EMBEDDINGS_MODEL_NAME,
-                        "embedding_date": datetime.datetime.now().strftime("%Y-%m-%d"),
-                        "embedding_dimension": len(embeddings[i])
-                    }
-                })
-            return results
+            embeddings = self._encode(texts, show_progress_bar=show_progress_bar)
+            return EmbeddingsBatch(
+                texts=texts,
+                vectors=np.ascontiguousarray(embeddings, dtype=np.float32),
+                metadata=EmbeddingsMetadata(
+                    embedding_model=EMBEDDINGS_MODEL_NAME,
+                    embedding_date=datetime.datetime.now().strftime("%Y-%m-%d"),
+                    embedding_dimension=embeddings.shape[1]
+                )
+            )
         except Exception as e:
             self.activity_logger.log_interaction(f"Error embedding multiple texts: {e}", "error")
             raise e
+
+    def _encode(self, texts: List[str], show_progress_bar: bool) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        # only the texts missing from the cache are sent to the model
+        if self.cache is None:
+            with self.model_lock:
+                return self.model.encode(texts, show_progress_bar=show_progress_bar)
+        keys = [self.cache.make_key(self.cache_model_name, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            start = time.perf_counter()
+            with self.model_lock:
+                vectors = self.model.encode(list(missing.values()), show_progress_bar=show_progress_bar)
+            new_vectors = dict(zip(missing.keys(), vectors.astype(np.float32)))
+            self.cache.put_many(new_vectors, encode_seconds=time.perf_counter() - start)
+            cached.update(new_vectors)
+        return np.stack([cached[key] for key in keys])
+
+    def cache_stats(self) -> Dict[str, float]:
+        # hits, misses, hit rate and estimated encode time saved by the cache
+        return self.cache.stats() if self.cache is not None else {}
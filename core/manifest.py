@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Tuple
+from core.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, EMBEDDINGS_MODEL_NAME, EMBEDDINGS_BACKEND
+from core.chunking import CHUNKER_VERSION
+from core.model_backends import backend_signature
+
+# anything that changes the indexed chunks or vectors of an unchanged file; the quantized backends
+# give slightly different vectors, queries must be embedded like the chunks
+EMBEDDINGS_SIGNATURE = backend_signature(EMBEDDINGS_BACKEND)
+INGESTION_SIGNATURE = (f"{EMBEDDINGS_MODEL_NAME}|backend:{EMBEDDINGS_SIGNATURE}"
+                       f"|chunks:v{CHUNKER_VERSION}:{CHUNK_MAX_TOKENS}/{CHUNK_OVERLAP_TOKENS}")
+
+
+class IngestionManifest:
+    # persistent record of the indexed raw files: path -> size, mtime, content hash, signature
+    def __init__(self, manifest_path: str, signature: str = INGESTION_SIGNATURE):
+        self.manifest_path = manifest_path
+        self.signature = signature
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get("files", {})
+        except FileNotFoundError:
+            self.entries = {}
+        except Exception as e:
+            print(f"MANIFEST: Could not read {self.manifest_path}, starting from scratch: {e}")
+            self.entries = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"files": self.entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            while block := f.read(1024 * 1024):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def diff(self, file_paths: List[str]) -> Tuple[List[str], List[str]]:
+        # returns (changed or new files, files removed since they were indexed)
+        with self.lock:
+            self._load()
+            changed = []
+            touched = False
+            for file_path in file_paths:
+                entry = self.entries.get(file_path)
+                if entry is None or entry.get("signature") != self.signature:
+                    changed.append(file_path)
+                    continue
+                stat = os.stat(file_path)
+                # the file is only hashed when its size or mtime moved
+                if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]:
+                    continue
+                if self.file_hash(file_path) != entry["hash"]:
+                    changed.append(file_path)
+                else:
+                    entry["mtime_ns"] = stat.st_mtime_ns
+                    touched = True
+            if touched:
+                self._save()
+            present = set(file_paths)
+            removed = [path for path in self.entries if path not in present]
+            return changed, removed
+
+    def record(self, file_paths: List[str]):
+        with self.lock:
+            self._load()
+            for file_path in file_paths:
+                stat = os.stat(file_path)
+                self.entries[file_path] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "hash": self.file_hash(file_path),
+                    "signature": self.signature
+                }
+            self._save()
+
+    def forget(self, file_paths: List[str]):
+        with self.lock:
+            self._load()
+            for file_path in file_paths:
+                self.entries.pop(file_path, None)
+            self._save()
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self._save()
@@ -0,0 +1,161 @@
+# cpu inference backends of the local models (embedding model and cross-encoder): fp32 torch,
+# torch with the linear layers quantized to int8, or onnxruntime (fp32 or int8) running a local
+# export made once with
+#   python -m core.model_backends --backend onnx-int8
+import argparse
+import os
+from core.config import (EMBEDDINGS_MODEL_NAME, EMBEDDINGS_BACKEND, EMBEDDINGS_NUM_THREADS, MODEL_EXPORT_DIR,
+                         ONNX_QUANTIZATION_CONFIG, RERANKER_MODEL_NAME, RERANKER_BACKEND, RERANKER_NUM_THREADS,
+                         RERANKER_INTEROP_THREADS)
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+def check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+
+def backend_signature(backend: str) -> str:
+    # what makes the vectors of a backend differ: the int8 onnx export depends on the quantization
+    # config, used by the embedding cache keys and the ingestion manifest
+    return f"{backend}:{ONNX_QUANTIZATION_CONFIG}" if backend == "onnx-int8" else backend
+
+
+def export_path(model_name: str) -> str:
+    return os.path.join(MODEL_EXPORT_DIR, model_name.replace("/", "--"))
+
+
+def onnx_file_name(backend: str) -> str:
+    return "onnx/model.onnx" if backend == "onnx" else f"onnx/model_qint8_{ONNX_QUANTIZATION_CONFIG}.onnx"
+
+
+def reranker_onnx_file_name(backend: str) -> str:
+    # names written by optimum, the cross-encoder is exported with it directly
+    return "model.onnx" if backend == "onnx" else "model_quantized.onnx"
+
+
+def set_num_threads(num_threads: int, interop_threads: int = 0):
+    # torch threads are a process setting, shared by every torch model of the process
+    import torch
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0 and torch.get_num_interop_threads() != interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # torch refuses once an inter-op parallel work has started
+            print(f"MODEL BACKENDS: inter-op threads left at {torch.get_num_interop_threads()}: {e}")
+
+
+def onnx_session_options(num_threads: int):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if num_threads > 0:
+        options.intra_op_num_threads = num_threads
+    return options
+
+
+def quantize_int8(model):
+    # weights of the linear layers stored in int8, activations quantized on the fly: no calibration
+    import torch
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def export_embedding_model(model_name: str, backend: str) -> str:
+    # offline step: the model is converted once and saved under MODEL_EXPORT_DIR
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    path = export_path(model_name)
+    if not os.path.exists(os.path.join(path, onnx_file_name("onnx"))):
+        print(f"MODEL EXPORT: exporting {model_name} to onnx in {path}")
+        SentenceTransformer(model_name, device="cpu", backend="onnx").save(path)
+    if backend == "onnx-int8" and not os.path.exists(os.path.join(path, onnx_file_name(backend))):
+        print(f"MODEL EXPORT: quantizing {model_name} to int8 ({ONNX_QUANTIZATION_CONFIG})")
+        export_dynamic_quantized_onnx_model(
+            SentenceTransformer(path, device="cpu", backend="onnx"), ONNX_QUANTIZATION_CONFIG, path)
+    return path
+
+
+def load_embedding_model(model_name: str = EMBEDDINGS_MODEL_NAME,
+                         backend: str = EMBEDDINGS_BACKEND,
+                         num_threads: int = EMBEDDINGS_NUM_THREADS):
+    from sentence_transformers import SentenceTransformer
+    check_backend(backend)
+    if backend in ("torch", "torch-int8"):
+        set_num_threads(num_threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        return quantize_int8(model) if backend == "torch-int8" else model
+    path = export_path(model_name)
+    if not os.path.exists(os.path.join(path, onnx_file_name(backend))):
+        # takes a few minutes, better done beforehand with python -m core.model_backends
+        print(f"MODEL EXPORT: no local {backend} export of {model_name}, exporting it now")
+        export_embedding_model(model_name, backend)
+    return SentenceTransformer(path, device="cpu", backend="onnx", model_kwargs={
+        "file_name": onnx_file_name(backend),
+        "provider": "CPUExecutionProvider",
+        "session_options": onnx_session_options(num_threads)
+    })
+
+
+def export_reranker_model(model_name: str, backend: str) -> str:
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    path = export_path(model_name)
+    if not os.path.exists(os.path.join(path, reranker_onnx_file_name("onnx"))):
+        print(f"MODEL EXPORT: exporting {model_name} to onnx in {path}")
+        ORTModelForSequenceClassification.from_pretrained(model_name, export=True).save_pretrained(path)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(path)
+    if backend == "onnx-int8" and not os.path.exists(os.path.join(path, reranker_onnx_file_name(backend))):
+        print(f"MODEL EXPORT: quantizing {model_name} to int8 ({ONNX_QUANTIZATION_CONFIG})")
+        quantization_config = getattr(AutoQuantizationConfig, ONNX_QUANTIZATION_CONFIG)(
+            is_static=False, per_channel=False)
+        ORTQuantizer.from_pretrained(path, file_name=reranker_onnx_file_name("onnx")).quantize(
+            save_dir=path, quantization_config=quantization_config)
+    return path
+
+
+def load_reranker_model(model_name: str = RERANKER_MODEL_NAME,
+                        backend: str = RERANKER_BACKEND,
+                        num_threads: int = RERANKER_NUM_THREADS,
+                        interop_threads: int = RERANKER_INTEROP_THREADS):
+    # (tokenizer, model), both backends take the tokenizer output and return torch logits
+    from transformers import AutoTokenizer
+    check_backend(backend)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend in ("torch", "torch-int8"):
+        from transformers import AutoModelForSequenceClassification
+        set_num_threads(num_threads, interop_threads)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        model.eval()
+        return tokenizer, quantize_int8(model) if backend == "torch-int8" else model
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    path = export_path(model_name)
+    if not os.path.exists(os.path.join(path, reranker_onnx_file_name(backend))):
+        print(f"MODEL EXPORT: no local {backend} export of {model_name}, exporting it now")
+        export_reranker_model(model_name, backend)
+    model = ORTModelForSequenceClassification.from_pretrained(
+        path,
+        file_name=reranker_onnx_file_name(backend),
+        provider="CPUExecutionProvider",
+        session_options=onnx_session_options(num_threads)
+    )
+    return tokenizer, model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="exports the local models for the onnx backends")
+    parser.add_argument("--backend", default="onnx-int8", choices=("onnx", "onnx-int8"))
+    parser.add_argument("--models", nargs="+", default=["embedder", "reranker"], choices=("embedder", "reranker"))
+    args = parser.parse_args()
+    if "embedder" in args.models:
+        print(f"MODEL EXPORT: {EMBEDDINGS_MODEL_NAME} exported in "
+              f"{export_embedding_model(EMBEDDINGS_MODEL_NAME, args.backend)}")
+    if "reranker" in args.models:
+        print(f"MODEL EXPORT: {RERANKER_MODEL_NAME} exported in "
+              f"{export_reranker_model(RERANKER_MODEL_NAME, args.backend)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# small dependency graph runner used by RAGPipeline: every stage starts as soon as its
+# dependencies are done, so the latency is the critical path instead of the sum of the stages
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import Any, Callable, Dict, List, Optional
+
+
+class StageCancelled(Exception):
+    # raised by a stage to stop the graph cleanly, e.g. when the guardrail rejects the question
+    def __init__(self, stage: str, reason: Any = None):
+        super().__init__(f"{stage} cancelled the pipeline")
+        self.stage = stage
+        self.reason = reason
+
+
+class StageFailed(Exception):
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"{stage} failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class Stage:
+    def __init__(self,
+                 name: str,
+                 function: Callable[[Dict[str, Any]], Any],
+                 depends_on: Optional[List[str]] = None):
+        self.name = name
+        self.function = function  # receives the results of the dependencies, keyed by stage name
+        self.depends_on = depends_on or []
+
+
+class StageGraph:
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dependency}")
+
+    def run(self,
+            executor: Executor,
+            on_stage_done: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+        # returns the results of every stage and the timings in results["_timings"];
+        # raises StageCancelled or StageFailed, the stages not started yet are never run and
+        # the running ones are left to finish in the pool, their results are dropped
+        results: Dict[str, Any] = {}
+        timings: Dict[str, float] = {}
+        cancelled = threading.Event()
+        running: Dict[Future, str] = {}
+        pending = dict(self.stages)
+
+        def timed(stage: Stage, inputs: Dict[str, Any]):
+            if cancelled.is_set():
+                raise StageCancelled(stage.name)
+            start = time.perf_counter()
+            result = stage.function(inputs)
+            return result, time.perf_counter() - start
+
+        def submit_ready():
+            for name, stage in list(pending.items()):
+                if all(dependency in results for dependency in stage.depends_on):
+                    inputs = {dependency: results[dependency] for dependency in stage.depends_on}
+                    running[executor.submit(timed, stage, inputs)] = name
+                    del pending[name]
+
+        try:
+            submit_ready()
+            while running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name], timings[name] = future.result()
+                    except StageCancelled:
+                        raise
+                    except Exception as e:
+                        raise StageFailed(name, e) from e
+                    if on_stage_done:
+                        on_stage_done(name, timings[name])
+                submit_ready()
+            if pending:
+                raise ValueError(f"Stages never ready (cycle?): {list(pending)}")
+        finally:
+            if running or pending:
+                cancelled.set()
+                for future in running:
+                    future.cancel()
+        results["_timings"] = timings
+        return results
@@ -2,24 +2,25 @@ from langchain.agents import create_agent
 from langchain.chat_models import init_chat_model
 from core.pipeline.prompts.generator import SYSTEM_PROMPT
 from core.config import GENERATOR_MODEL_NAME
-from typing import List
-from langchain.tools import ToolRuntime
-from langgraph.checkpoint.memory import InMemorySaver
+from typing import Dict, Iterator, List, Optional
+from core.pipeline.memory import ConversationMemory
 from core.vector_store.logger import ActivityLogger
 
+GENERATION_ERROR_ANSWER = "There was an error generating the answer."
+
 
 class QAAgent:
     def __init__(self, model_name=GENERATOR_MODEL_NAME,
                  system_prompt=SYSTEM_PROMPT,
                  temperature=0.7,
-                 checkpointer: ToolRuntime = InMemorySaver()  # type: ignore
+                 memory: Optional[ConversationMemory] = None
                  ):
         self.model_name = model_name
         self.system_prompt = system_prompt
         self.temperature = temperature
-        self.checkpointer = checkpointer
+        # one bounded thread per conversation instead of a checkpointer replaying every message
+        self.memory = memory if memory is not None else ConversationMemory()
         self.agent = self._initialize_agent()
-        self.config = {"configurable": {"thread_id": "1"}}
         self.activity_logger = ActivityLogger("qa_agent")
 
     def _initialize_agent(self):
@@ -33,29 +34,61 @@ class QAAgent:
             return create_agent(
                 model=model,
                 system_prompt=self.system_prompt,
-                checkpointer=self.checkpointer,  # type: ignore
                 name="QA Agent",
             )
         except Exception as e:
             self.activity_logger.log_interaction(f"Error initializing QA Agent: {e}", "error")
             raise e
 
-    def answer(self, question: str, chunks: List[str]):
+    def answer(self, question: str, chunks: List[str], conversation_id: Optional[str] = None):
         try:
-            context = "\n\n".join(chunks)
-            prompt = {
-                "messages": [
-                    {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
-                ]
-            }
-
-            response = self.agent.invoke(prompt, config=self.config)  # type: ignore
+            response = self.agent.invoke(self._build_prompt(question, chunks, conversation_id))  # type: ignore
             answer = self.get_answer(response)
             self.activity_logger.log_interaction(f"Generated answer: {answer}", "info")
+            self.memory.append(conversation_id, question, answer)
             return answer
         except Exception as e:
             self.activity_logger.log_interaction(f"Error generating answer: {e}", "error")
-            return "There was an error generating the answer."
+            return GENERATION_ERROR_ANSWER
+
+    def stream_answer(self,
+                      question: str,
+                      chunks: List[str],
+                      conversation_id: Optional[str] = None) -> Iterator[str]:
+        # yields the answer token by token as the model generates it, raises if the generation
+        # fails (even after some tokens) so that the caller can report it
+        answer = ""
+        try:
+            for message, _ in self.agent.stream(  # type: ignore
+                    self._build_prompt(question, chunks, conversation_id), stream_mode="messages"):
+                token = self._get_token(message)
+                if token:
+                    answer += token
+                    yield token
+            self.activity_logger.log_interaction(f"Generated answer: {answer}", "info")
+            self.memory.append(conversation_id, question, answer)
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error generating answer: {e}", "error")
+            raise e
+
+    def _build_prompt(self, question: str, chunks: List[str], conversation_id: Optional[str] = None) -> Dict:
+        # the memory only holds the questions and answers, the retrieved context is sent once
+        context = "\n\n".join(chunks)
+        return {
+            "messages": self.memory.get_messages(conversation_id, question) + [
+                {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
+            ]
+        }
+
+    @staticmethod
+    def _get_token(message) -> str:
+        # only the chunks of the model answer, not the echoed user message or tool messages
+        if getattr(message, "type", "") not in ("AIMessageChunk", "ai"):
+            return ""
+        content = message.content
+        if isinstance(content, list):  # providers returning content blocks
+            return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+        return content or ""
 
     def get_answer(self, response) -> str:
         try:
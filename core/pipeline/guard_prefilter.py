@@ -0,0 +1,96 @@
+# local pre-filter of the guardrail: the question embedding is compared to in-domain and
+# off-domain reference questions, only the questions without a clear margin go to GuardAgent
+import threading
+from collections import deque
+from typing import Dict, Optional
+import numpy as np
+from core.embeddings import Embedder
+from core.types import GuardAgentResponse
+from core.pipeline.prompts.guard_prototypes import IN_DOMAIN_EXAMPLES, OFF_DOMAIN_EXAMPLES
+from core.config import (GUARD_PREFILTER_ACCEPT_MARGIN, GUARD_PREFILTER_REJECT_MARGIN,
+                         GUARD_PREFILTER_TOP_K, GUARD_PREFILTER_MAX_LEARNED)
+
+OFF_DOMAIN_REASON = "La question ne semble pas relever du domaine juridique."
+
+
+class GuardPrefilter:
+    def __init__(self,
+                 embedder: Embedder,
+                 accept_margin: float = GUARD_PREFILTER_ACCEPT_MARGIN,
+                 reject_margin: float = GUARD_PREFILTER_REJECT_MARGIN,
+                 top_k: int = GUARD_PREFILTER_TOP_K,
+                 max_learned: int = GUARD_PREFILTER_MAX_LEARNED):
+        self.embedder = embedder
+        self.accept_margin = accept_margin
+        self.reject_margin = reject_margin
+        self.top_k = top_k
+        self.lock = threading.Lock()
+        self.in_domain = self._normalise(embedder.embed_multiple_texts(IN_DOMAIN_EXAMPLES).vectors)
+        self.off_domain = self._normalise(embedder.embed_multiple_texts(OFF_DOMAIN_EXAMPLES).vectors)
+        # rejections of GuardAgent on the ambiguous questions, added to the off-domain references;
+        # the accepts only come from the curated examples
+        self.learned_off: deque = deque(maxlen=max_learned)
+        self.local_accepts = 0
+        self.local_rejects = 0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+
+    @staticmethod
+    def _normalise(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def _class_score(self, references: np.ndarray, learned: Optional[deque], vector: np.ndarray) -> float:
+        if learned:
+            references = np.vstack([references, np.stack(learned)])
+        similarities = references @ vector
+        top_k = min(self.top_k, len(similarities))
+        return float(np.mean(np.partition(similarities, -top_k)[-top_k:]))
+
+    def margin(self, vector) -> float:
+        # > 0 the question is closer to the legal questions, < 0 to the off-domain ones
+        vector = self._normalise(vector)[0]
+        with self.lock:
+            return (self._class_score(self.in_domain, None, vector)
+                    - self._class_score(self.off_domain, self.learned_off, vector))
+
+    def classify(self, question: str) -> Optional[GuardAgentResponse]:
+        # returns the local decision, or None when the question is in the ambiguous band
+        margin = self.margin(self.embedder.embed_text(question).embeddings)
+        if margin >= self.accept_margin:
+            with self.lock:
+                self.local_accepts += 1
+            print(f"GUARD PREFILTER: accepted locally (margin {margin:.3f})")
+            return GuardAgentResponse(isSafe=True)
+        if margin <= -self.reject_margin:
+            with self.lock:
+                self.local_rejects += 1
+            print(f"GUARD PREFILTER: rejected locally (margin {margin:.3f})")
+            return GuardAgentResponse(isSafe=False, reasons=OFF_DOMAIN_REASON)
+        print(f"GUARD PREFILTER: ambiguous (margin {margin:.3f}), asking the guard agent")
+        return None
+
+    def record_llm_decision(self, question: str, response: GuardAgentResponse, seconds: float):
+        # the ambiguous questions rejected by GuardAgent refine the off-domain references
+        with self.lock:
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+        if not response.isSafe:
+            vector = self._normalise(self.embedder.embed_text(question).embeddings)[0]
+            with self.lock:
+                self.learned_off.append(vector)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            local = self.local_accepts + self.local_rejects
+            total = local + self.llm_calls
+            seconds_per_call = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            return {
+                "local_accepts": self.local_accepts,
+                "local_rejects": self.local_rejects,
+                "llm_calls": self.llm_calls,
+                "llm_calls_avoided_ratio": local / total if total else 0.0,
+                "estimated_seconds_saved": local * seconds_per_call
+            }
+
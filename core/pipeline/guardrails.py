@@ -6,6 +6,8 @@ from langchain.chat_models import init_chat_model
 from core.pipeline.prompts.guardrails import SYSTEM_PROMPT
 from core.config import GUARDRAILS_MODEL_NAME
 from core.vector_store.logger import ActivityLogger
+from core.agent_cache import agent_cache_for, cached_call
+from typing import Optional
 
 
 class GuardAgent:
@@ -13,10 +15,12 @@ class GuardAgent:
             self,
             model_name=GUARDRAILS_MODEL_NAME,
             system_prompt=SYSTEM_PROMPT,
-            temperature=0.2):
+            temperature=0.2,
+            use_cache: Optional[bool] = None):
         self.model_name = model_name
         self.system_prompt = system_prompt
         self.temperature = temperature
+        self.cache = agent_cache_for("guard", use_cache)
         self.agent = self._initialize_agent()
         self.activity_logger = ActivityLogger("guard_agent")
 
@@ -40,19 +44,25 @@ class GuardAgent:
 
     def validate_question(self, question: str) -> GuardAgentResponse:
         try:
-            prompt = {
-                "messages": [{"role": "user", "content": f"{question}"}]
-            }
-            response = self.agent.invoke(prompt)  # type: ignore
-
-            # verify that structured_response is inside
-            if isinstance(response, dict) and 'structured_response' in response:
-                response = response['structured_response']
-                return response
-            else:
-                print("Invalid response structure from guard agent:", response)
+            response = cached_call(self.cache, (self.model_name, self.system_prompt, self.temperature, question),
+                                   "guard", GuardAgentResponse, lambda: self._invoke(question))
+            if response is None:
                 return GuardAgentResponse(
                     **{"isSafe": False, "reasons": "Invalid response structure"})
+            return response
         except Exception as e:
             self.activity_logger.log_interaction(f"Error validating question: {e}", "error")
             raise e
+
+    def _invoke(self, question: str) -> Optional[GuardAgentResponse]:
+        # None when the response has no structured output, it is not cached
+        prompt = {
+            "messages": [{"role": "user", "content": f"{question}"}]
+        }
+        response = self.agent.invoke(prompt)  # type: ignore
+
+        # verify that structured_response is inside
+        if isinstance(response, dict) and 'structured_response' in response:
+            return response['structured_response']
+        print("Invalid response structure from guard agent:", response)
+        return None
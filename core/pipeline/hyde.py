@@ -6,13 +6,17 @@ from langchain.chat_models import init_chat_model
 from core.pipeline.prompts.hyde import SYSTEM_PROMPT
 from core.config import HYDE_MODEL_NAME
 from core.vector_store.logger import ActivityLogger
+from core.agent_cache import agent_cache_for, cached_call
+from typing import Optional
 
 
 class HyDEAgent:
-    def __init__(self, model_name=HYDE_MODEL_NAME, system_prompt=SYSTEM_PROMPT, temperature=0.7):
+    def __init__(self, model_name=HYDE_MODEL_NAME, system_prompt=SYSTEM_PROMPT, temperature=0.7,
+                 use_cache: Optional[bool] = None):
         self.model_name = model_name
         self.system_prompt = system_prompt
         self.temperature = temperature
+        self.cache = agent_cache_for("hyde", use_cache)
         self.agent = self._initialize_agent()
         self.activity_logger = ActivityLogger("hyde_agent")
 
@@ -36,19 +40,25 @@ class HyDEAgent:
 
     def generate_hyde(self, question: str) -> HyDEAgentResponse:
         try:
-            prompt = {
-                "messages": [{"role": "user", "content": f"{question}"}]
-            }
-            response = self.agent.invoke(prompt)  # type: ignore
-
-            # verify that structured_response is inside
-            if isinstance(response, dict) and 'structured_response' in response:
-                response = response['structured_response']
-                return response
-            else:
-                print("Invalid response structure from hyde agent:", response)
+            response = cached_call(self.cache, (self.model_name, self.system_prompt, self.temperature, question),
+                                   "hyde", HyDEAgentResponse, lambda: self._invoke(question))
+            if response is None:
                 return HyDEAgentResponse(
                     **{"isSafe": False, "reasons": "Invalid response structure"})
+            return response
         except Exception as e:
             self.activity_logger.log_interaction(f"Error generating HyDE: {e}", "error")
             raise e
+
+    def _invoke(self, question: str) -> Optional[HyDEAgentResponse]:
+        # None when the response has no structured output, it is not cached
+        prompt = {
+            "messages": [{"role": "user", "content": f"{question}"}]
+        }
+        response = self.agent.invoke(prompt)  # type: ignore
+
+        # verify that structured_response is inside
+        if isinstance(response, dict) and 'structured_response' in response:
+            return response['structured_response']
+        print("Invalid response structure from hyde agent:", response)
+        return None
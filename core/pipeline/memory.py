@@ -0,0 +1,152 @@
+# bounded memory of the QA agent: one thread per History conversation holding a sliding window of
+# messages and a rolling summary of the older ones; threads are restored from the message index
+# and the least recently used ones are evicted from process memory
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from langchain.chat_models import init_chat_model
+from core.pipeline.prompts.summary import SYSTEM_PROMPT
+from core.vector_store.history import History
+from core.registry import get_history
+from core.vector_store.logger import ActivityLogger
+from core.config import (SUMMARY_MODEL_NAME, CONVERSATION_WINDOW_MESSAGES, CONVERSATION_TOKEN_BUDGET,
+                         CONVERSATION_MAX_THREADS)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for a budget
+    return len(text) // 4 + 1
+
+
+class ConversationMemory:
+    def __init__(self,
+                 history: Optional[History] = None,
+                 window_messages: int = CONVERSATION_WINDOW_MESSAGES,
+                 token_budget: int = CONVERSATION_TOKEN_BUDGET,
+                 max_threads: int = CONVERSATION_MAX_THREADS,
+                 model_name: str = SUMMARY_MODEL_NAME):
+        self.history = history
+        self.window_messages = window_messages
+        self.token_budget = token_budget
+        self.max_threads = max_threads
+        self.model_name = model_name
+        self.model = None  # created at the first summary
+        self.threads: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = threading.Lock()
+        # summaries are written in the background, one at a time, never on the answer path
+        self.summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory")
+        self.activity_logger = ActivityLogger("conversation_memory")
+
+    def get_messages(self, thread_id: Optional[str], question: str = "") -> List[Dict]:
+        # messages to put before the question: the summary as a system message, then the window;
+        # a question asked outside of a conversation has no memory, the memory is shared by the sessions
+        if not thread_id:
+            return []
+        thread = self._get_thread(thread_id, question)
+        with self.lock:
+            messages = list(thread["messages"])
+            summary = thread["summary"]
+        if summary:
+            messages.insert(0, {"role": "system", "content": f"Résumé de la conversation précédente :\n{summary}"})
+        return messages
+
+    def append(self, thread_id: Optional[str], question: str, answer: str):
+        if not thread_id:
+            return
+        thread = self._get_thread(thread_id)
+        with self.lock:
+            thread["messages"].extend([
+                {"role": "user", "content": question},
+                {"role": "assistant", "content": answer}
+            ])
+            over_budget = self._tokens(thread["messages"]) > self.token_budget
+            if over_budget and not thread["summarizing"]:
+                thread["summarizing"] = True
+                self.summarizer.submit(self._compact, thread_id, thread)
+
+    def forget(self, thread_id: str):
+        with self.lock:
+            self.threads.pop(thread_id, None)
+
+    def _get_thread(self, thread_id: str, question: str = "") -> Dict:
+        with self.lock:
+            thread = self.threads.get(thread_id)
+            if thread is not None:
+                self.threads.move_to_end(thread_id)
+                return thread
+        thread = {"summary": "", "messages": [], "summarizing": False}
+        thread["summary"], thread["messages"] = self._restore(thread_id, question)
+        with self.lock:
+            # another request may have restored it meanwhile
+            thread = self.threads.setdefault(thread_id, thread)
+            self.threads.move_to_end(thread_id)
+            while len(self.threads) > self.max_threads:
+                self.threads.popitem(last=False)
+        return thread
+
+    def _restore(self, conversation_id: str, question: str):
+        # only the latest summary and the last messages are read, not the whole conversation
+        try:
+            if self.history is None:
+                self.history = get_history()
+            summary = self.history.load_summary(conversation_id)
+            messages = self.history.load_recent_messages(conversation_id, self.window_messages)
+            # the page saves the question before asking it, it must not be replayed twice
+            if messages and messages[-1]["role"] == "user" and messages[-1]["content"] == question:
+                messages = messages[:-1]
+            # with a summary, the older messages of the window are most likely already in it
+            while summary and len(messages) > 2 and self._tokens(messages) > self.token_budget // 2:
+                messages = messages[2:]
+            return summary, messages
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error restoring conversation {conversation_id}: {e}", "error")
+            return "", []
+
+    def _tokens(self, messages: List[Dict]) -> int:
+        return sum(estimate_tokens(message["content"]) for message in messages)
+
+    def _compact(self, thread_id: str, thread: Dict):
+        # the oldest messages are folded into the summary until the window is at half the budget
+        nb_folded = 0
+        try:
+            with self.lock:
+                messages = thread["messages"]
+                nb_folded = 0
+                while nb_folded < len(messages) - 2 and \
+                        self._tokens(messages[nb_folded:]) > self.token_budget // 2:
+                    nb_folded += 2  # question and answer
+                folded = messages[:nb_folded]
+                summary = thread["summary"]
+            if not folded:
+                return
+            new_summary = self._summarize(summary, folded)
+            with self.lock:
+                thread["summary"] = new_summary
+                # messages appended meanwhile are kept, only the folded ones go away
+                del thread["messages"][:nb_folded]
+            nb_folded = 0
+            if self.history is not None:
+                self.history.save_summary(thread_id, new_summary)
+            print(f"MEMORY: {len(folded)} messages of {thread_id} folded into the summary")
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error summarizing conversation {thread_id}: {e}", "error")
+            if nb_folded:
+                # the window stays bounded without a summary too: the turns that were to be folded
+                # are dropped from the prompt, they are still in the message index
+                with self.lock:
+                    del thread["messages"][:nb_folded]
+                print(f"MEMORY: {nb_folded} messages of {thread_id} dropped, summary failed")
+        finally:
+            with self.lock:
+                thread["summarizing"] = False
+
+    def _summarize(self, summary: str, messages: List[Dict]) -> str:
+        if self.model is None:
+            self.model = init_chat_model(model=self.model_name, temperature=0.2, timeout=10, max_tokens=500)
+        exchanges = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        response = self.model.invoke([
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Résumé existant :\n{summary or '(vide)'}\n\nNouveaux échanges :\n{exchanges}"}
+        ])
+        return response.content
@@ -1,154 +1,358 @@
 from core.pipeline.guardrails import GuardAgent
 from core.pipeline.rewriter import RewriterAgent
 from core.pipeline.hyde import HyDEAgent
-from core.pipeline.reranker import Reranker
-from core.pipeline.generator import QAAgent
-from core.types import GuardAgentResponse, ElasticsearchAnswer, RAGResponse, ElasticsearchAnswerItem
+from core.registry import get_reranker
+from core.pipeline.generator import QAAgent, GENERATION_ERROR_ANSWER
+from core.pipeline.guard_prefilter import GuardPrefilter
+from core.pipeline.planner import PlannerAgent
+from core.pipeline.dag import Stage, StageGraph, StageCancelled, StageFailed
+from core.types import (GuardAgentResponse, ElasticsearchAnswer, RAGResponse, ElasticsearchAnswerItem, RAGStreamEvent,
+                        RewriterAgentResponse, GENERATION_FAILED_ERROR)
 from core.vector_store.retriever import Retriever
-from typing import Dict, List, Optional, Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Callable
+import time
 from core.utils import Utils
 from core.vector_store.logger import ActivityLogger
+from core.semantic_cache import SemanticCache, get_semantic_cache
+from core.agent_cache import get_agent_cache
+from core.config import (PIPELINE_MAX_WORKERS, PIPELINE_TOP_K, PIPELINE_RERANK_TOP_N,
+                         SEMANTIC_CACHE_ENABLED, AGENT_CACHE_ENABLED, GUARD_PREFILTER_ENABLED, PIPELINE_MODE,
+                         FAST_PATH_RETRIEVAL_MODE, FAST_PATH_MIN_SCORE, FAST_PATH_MIN_MARGIN)
+
+# status shown when a stage is done, and error returned when it fails
+STAGE_MESSAGES = {
+    "guard": ("Question passed guardrails", "Guardrail validation failed"),
+    "plan": ("Question checked, rewritten and HyDE generated", "Query planning failed"),
+    "rewrite": ("Rewritten question successfully", "Question rewriting failed"),
+    "hyde": ("HyDE generated successfully", "HyDE generation failed"),
+    "retrieve_raw": ("Retrieved documents for the question", "Document retrieval failed"),
+    "retrieve_rewritten": ("Retrieved documents for rewritten question", "Document retrieval failed"),
+    "retrieve_hyde": ("Retrieved documents for HyDE", "Document retrieval failed"),
+    "retrieve_plan": ("Retrieved documents for rewritten question and HyDE", "Document retrieval failed"),
+    "rerank": ("Reranked documents", "Document reranking failed"),
+    "generate": ("Final answer generated", GENERATION_FAILED_ERROR),
+}
 
 
 class RAGPipeline:
-    def __init__(self):
+    def __init__(self, semantic_cache: Optional[SemanticCache] = None, mode: str = PIPELINE_MODE):
+        self.mode = mode  # default mode, process_query and stream_query can override it per query
         self.guard_agent = GuardAgent()
         self.rewriter_agent = RewriterAgent()
         self.hyde_agent = HyDEAgent()
+        self.planner_agent = PlannerAgent()
+        self.slow_path_seconds: Optional[float] = None  # moving average of rewrite + HyDE, adaptive mode
         self.retriever = Retriever()
-        self.reranker = Reranker()
+        self.reranker = get_reranker()
         self.qa_agent = QAAgent()
         self.utils = Utils()
         self.activity_logger = ActivityLogger("rag_pipeline")
+        self.executor = ThreadPoolExecutor(max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="rag")
+        # clearly legal or clearly off-topic questions are decided without the LLM guard call
+        self.guard_prefilter = GuardPrefilter(self.retriever.embedder) if GUARD_PREFILTER_ENABLED else None
+        self.semantic_cache = semantic_cache if semantic_cache is not None else (
+            get_semantic_cache() if SEMANTIC_CACHE_ENABLED else None)
 
-    def process_query(self,
-                      question: str,
-                      status_callback: Optional[Callable[[str], None]] = None
-                      ) -> RAGResponse:
+    def build_graph(self,
+                    question: str,
+                    with_generation: bool = True,
+                    mode: Optional[str] = None,
+                    conversation_id: Optional[str] = None) -> StageGraph:
+        # "agents": guard || rewrite -> (retrieve rewritten || hyde -> retrieve hyde) -> rerank -> generate
+        # "planner": plan -> retrieve rewritten + hyde (one encode, one _msearch) -> rerank -> generate
+        # "adaptive": guard || retrieve raw -> same as "agents", rewrite and hyde return at once when
+        #             the raw question retrieval is confident enough
+        # the answer is only generated once the guardrail accepted the question; without
+        # generation the caller streams the answer itself once the graph is done
+        mode = mode or self.mode
+        if mode not in ("agents", "planner", "adaptive"):
+            raise ValueError(f"Unknown pipeline mode: {mode}")
 
-        def update_status(message: str):  # this will be used in front to display the state
-            """Helper to update status if callback is provided"""
-            if status_callback:
-                status_callback(message)
-            print(f"RAGPPELINE: {message}")
+        def guard(_):
+            guard_response = self.validate_question(question)
+            if not guard_response.isSafe:
+                raise StageCancelled("guard", guard_response.reasons)
+            return guard_response
 
-        # first step are the guardrails
-        try:
-            update_status("Checking guardrails...")
-            guard_response = self.guard_agent.validate_question(question)
-            if guard_response.isSafe:
-                update_status("Question passed guardrails.")
-            else:
-                update_status(f"Question failed guardrails: {guard_response.reasons}")
-                return self.utils.construct_RAGResponse(
-                    answer="",
-                    error="Question did not pass guardrails",
-                    details=guard_response.reasons
-                )
-        except Exception as e:
-            self.activity_logger.log_interaction(f"Error during guardrail validation: {e}", "error")
-            return self.utils.construct_RAGResponse(
-                answer="",
-                error="Guardrail validation failed",
-                details=str(e)
-            )
+        def plan(_):
+            # the guard verdict comes with the plan, the local pre-filter would not save a call
+            plan_response = self.planner_agent.plan(question)
+            if not plan_response.isSafe:
+                raise StageCancelled("plan", plan_response.reasons)
+            return plan_response
 
-        # second step is the rewriting of the question if needed
-        try:
-            update_status("Rewriting question if needed...")
+        def fast_path(inputs: Dict[str, Any]) -> bool:
+            return "retrieve_raw" in inputs and self.is_confident(inputs["retrieve_raw"])
 
-            rewritten_question = self.rewriter_agent.rewrite_question(question)
-        except Exception as e:
-            self.activity_logger.log_interaction(f"Error during question rewriting: {e}", "error")
-            return self.utils.construct_RAGResponse(
-                answer="",
-                error="Question rewriting failed",
-                details=str(e)
-            )
-        update_status("Rewritten question successfully")
+        def rewrite(inputs: Dict[str, Any]) -> RewriterAgentResponse:
+            if fast_path(inputs):
+                return RewriterAgentResponse(neededRewrite=False, rewritten_question=question)
+            return self.rewriter_agent.rewrite_question(question)
 
-        # third step is the HyDE generation
-        try:
+        def hyde(inputs: Dict[str, Any]):
+            if fast_path(inputs):
+                return None
+            return self.hyde_agent.generate_hyde(inputs["rewrite"].rewritten_question)
 
-            update_status("Generating HyDE...")
-            hyde_response = self.hyde_agent.generate_hyde(rewritten_question.rewritten_question)
+        def retrieve_rewritten(inputs: Dict[str, Any]) -> ElasticsearchAnswer:
+            if fast_path(inputs):
+                return ElasticsearchAnswer(hits=[])  # the rewritten question is the raw one
+            return self.retriever.retrieve_documents(
+                inputs[rewrite_stage].rewritten_question, top_k=PIPELINE_TOP_K, source="Rewritten")
 
-        except Exception as e:
-            self.activity_logger.log_interaction(f"Error during HyDE generation: {e}", "error")
-            return self.utils.construct_RAGResponse(
-                answer="",
-                error="HyDE generation failed",
-                details=str(e)
-            )
-        update_status(f"HyDE generated successfully")
+        def retrieve_hyde(inputs: Dict[str, Any]) -> ElasticsearchAnswer:
+            if inputs[hyde_stage] is None:
+                return ElasticsearchAnswer(hits=[])
+            return self.retriever.retrieve_documents(
+                inputs[hyde_stage].hypothetical_answer, top_k=PIPELINE_TOP_K, source="HyDE")
+
+        def retrieve_plan(inputs: Dict[str, Any]) -> ElasticsearchAnswer:
+            # the plan gives both texts at once, no need for two retrieval stages
+            plan_response = inputs["plan"]
+            return self.retriever.retrieve_many(
+                [plan_response.rewritten_question, plan_response.hypothetical_answer],
+                top_k=PIPELINE_TOP_K, sources=["Rewritten", "HyDE"])
+
+        # PlannerAgentResponse has the rewritten_question and hypothetical_answer fields too
+        guard_stage, rewrite_stage, hyde_stage = (
+            ("plan", "plan", "plan") if mode == "planner" else ("guard", "rewrite", "hyde"))
+        retrieval_stages = ["retrieve_plan"] if mode == "planner" else ["retrieve_rewritten", "retrieve_hyde"]
+        # the rewrite and hyde stages wait for the raw question retrieval in adaptive mode
+        probe = ["retrieve_raw"] if mode == "adaptive" else []
+        if probe:
+            retrieval_stages.insert(0, "retrieve_raw")
+
+        def rerank(inputs: Dict[str, Any]) -> ElasticsearchAnswer:
+            merged_docs = self.retriever.merge_answers([inputs[stage] for stage in retrieval_stages])
+            return self.reranker.rerank(
+                inputs[rewrite_stage].rewritten_question or question, merged_docs, top_n=PIPELINE_RERANK_TOP_N)
+
+        def generate(inputs: Dict[str, Any]) -> str:
+            reranked_contents = [doc.content for doc in inputs["rerank"].hits]
+            return self.qa_agent.answer(question, reranked_contents, conversation_id)
+
+        if mode == "planner":
+            stages = [Stage("plan", plan)]
+        else:
+            stages = [
+                Stage("guard", guard),
+                Stage("rewrite", rewrite, probe),
+                Stage("hyde", hyde, ["rewrite"] + probe),
+            ]
+        if probe:
+            stages.append(Stage("retrieve_raw", lambda _: self.retriever.retrieve_documents(
+                question, top_k=PIPELINE_TOP_K, source="Raw", mode=FAST_PATH_RETRIEVAL_MODE)))
+        if mode == "planner":
+            stages.append(Stage("retrieve_plan", retrieve_plan, ["plan"]))
+        else:
+            stages += [
+                Stage("retrieve_rewritten", retrieve_rewritten, [rewrite_stage] + probe),
+                Stage("retrieve_hyde", retrieve_hyde, [hyde_stage]),
+            ]
+        stages.append(Stage("rerank", rerank, list(dict.fromkeys([rewrite_stage] + retrieval_stages))))
+        if with_generation:
+            stages.append(Stage("generate", generate, [guard_stage, "rerank"]))
+        return StageGraph(stages)
+
+    def is_confident(self, answer: ElasticsearchAnswer) -> bool:
+        scores = sorted((hit.score for hit in answer.hits), reverse=True)
+        if not scores:
+            return False
+        margin = scores[0] - scores[1] if len(scores) > 1 else 0.0
+        return scores[0] >= FAST_PATH_MIN_SCORE or margin >= FAST_PATH_MIN_MARGIN
 
-        # Then we should have two parrallel steps the retrieval, I will do it sequentially to simplify
-        # retrieval for rewritten question
+    def _log_adaptive_decision(self, results: Dict[str, Any]):
+        timings = results["_timings"]
+        scores = sorted((hit.score for hit in results["retrieve_raw"].hits), reverse=True)
+        top_score = scores[0] if scores else 0.0
+        margin = scores[0] - scores[1] if len(scores) > 1 else 0.0
+        if results["hyde"] is None:
+            saved = f"~{self.slow_path_seconds:.2f}s saved" if self.slow_path_seconds else "no estimate yet"
+            decision = f"fast path, rewrite and HyDE skipped ({saved})"
+        else:
+            # rewrite -> hyde -> retrieve hyde is the chain the fast path removes
+            slow_path = timings["rewrite"] + timings["hyde"] + timings["retrieve_hyde"]
+            self.slow_path_seconds = slow_path if self.slow_path_seconds is None else (
+                0.8 * self.slow_path_seconds + 0.2 * slow_path)
+            decision = f"full path, rewrite and HyDE took {slow_path:.2f}s"
+        self.activity_logger.log_interaction(
+            f"Adaptive retrieval: top score {top_score:.3f}, margin {margin:.3f} -> {decision}", "info")
+
+    def validate_question(self, question: str) -> GuardAgentResponse:
+        if self.guard_prefilter is not None:
+            decision = self.guard_prefilter.classify(question)
+            if decision is not None:
+                return decision
+        start = time.perf_counter()
+        guard_response = self.guard_agent.validate_question(question)
+        if self.guard_prefilter is not None:
+            self.guard_prefilter.record_llm_decision(question, guard_response, time.perf_counter() - start)
+            self.activity_logger.log_interaction(
+                f"Guard prefilter stats: {self.guard_prefilter.stats()}", "info")
+        return guard_response
+
+    def process_query(self,
+                      question: str,
+                      status_callback: Optional[Callable[[str], None]] = None,
+                      mode: Optional[str] = None,
+                      conversation_id: Optional[str] = None
+                      ) -> RAGResponse:
+        update_status = self._status_updater(status_callback)
+        start = time.perf_counter()
+        question_vector, cached_response = self._cache_lookup(question, conversation_id, update_status)
+        if cached_response is not None:
+            if not cached_response.error:
+                self.qa_agent.memory.append(conversation_id, question, cached_response.answer)
+            return cached_response
+        results = self._run_graph(
+            question, update_status, with_generation=True, mode=mode, conversation_id=conversation_id)
+        if isinstance(results, RAGResponse):
+            return results
+        self._log_timings(results["_timings"], time.perf_counter() - start, update_status)
+        response = self.utils.construct_RAGResponse(
+            answer=results["generate"],
+            source_documents=results["rerank"]
+        )
+        self._cache_store(question, question_vector, response)
+        return response
+
+    def stream_query(self,
+                     question: str,
+                     status_callback: Optional[Callable[[str], None]] = None,
+                     mode: Optional[str] = None,
+                     conversation_id: Optional[str] = None
+                     ) -> Iterator[RAGStreamEvent]:
+        # same stages as process_query, the answer comes as "token" events and a "final" event
+        # carries the sources (or the error) once the generation is over
+        update_status = self._status_updater(status_callback)
+        start = time.perf_counter()
+        question_vector, cached_response = self._cache_lookup(question, conversation_id, update_status)
+        if cached_response is not None:
+            if not cached_response.error:
+                self.qa_agent.memory.append(conversation_id, question, cached_response.answer)
+                yield RAGStreamEvent(type="token", token=cached_response.answer)
+            yield RAGStreamEvent(type="final", response=cached_response)
+            return
+        results = self._run_graph(question, update_status, with_generation=False, mode=mode)
+        if isinstance(results, RAGResponse):
+            yield RAGStreamEvent(type="final", response=results)
+            return
+
+        update_status("Generating final answer...")
+        reranked_docs = results["rerank"]
+        answer = ""
+        generation_start = time.perf_counter()
         try:
-            update_status("Retrieving documents for rewritten question...")
-            rewritten_docs = self.retriever.retrieve_documents(
-                rewritten_question.rewritten_question, top_k=4, source="Rewritten")
-            update_status(f"Retrieved {len(rewritten_docs.hits)} documents for rewritten question.")
+            for token in self.qa_agent.stream_answer(
+                    question, [doc.content for doc in reranked_docs.hits], conversation_id):
+                if not answer:
+                    # the metric that matters for the chat page
+                    self.activity_logger.log_interaction(
+                        f"Time to first token: {time.perf_counter() - start:.2f}s", "info")
+                answer += token
+                yield RAGStreamEvent(type="token", token=token)
         except Exception as e:
-            self.activity_logger.log_interaction(f"Error during document retrieval: {e}", "error")
-            update_status(f"Error during document retrieval: {e}")
-            return self.utils.construct_RAGResponse(
-                answer="",
-                error="Document retrieval for rewritten question failed",
-                details=str(e)
-            )
+            # the partial answer is dropped: not cached, and the page does not save it
+            update_status(f"Error during stage generate: {e}")
+            yield RAGStreamEvent(type="final", response=self.utils.construct_RAGResponse(
+                answer="", error=GENERATION_FAILED_ERROR, details=str(e)))
+            return
+
+        results["_timings"]["generate"] = time.perf_counter() - generation_start
+        self._log_timings(results["_timings"], time.perf_counter() - start, update_status)
+        response = self.utils.construct_RAGResponse(answer=answer, source_documents=reranked_docs)
+        self._cache_store(question, question_vector, response)
+        yield RAGStreamEvent(type="final", response=response)
 
-        # retrieval for hyde question
+    def _cache_lookup(self, question: str, conversation_id: Optional[str], update_status: Callable[[str], None]):
+        # returns (question embedding, cached response or None); a failing cache never blocks a query.
+        # an answer depends on the conversation memory, so only the questions asked with an empty
+        # memory are looked up and stored (no embedding is returned otherwise, see _cache_store).
+        # a hit skips the retrieval and the generation but still goes through the guardrail
+        if self.semantic_cache is None:
+            return None, None
         try:
-            update_status("Retrieving documents for HyDE question...")
-            hyde_docs = self.retriever.retrieve_documents(
-                hyde_response.hypothetical_answer, top_k=4, source="HyDE")
-            update_status(f"Retrieved {len(hyde_docs.hits)} documents for HyDE question.")
+            if self.qa_agent.memory.get_messages(conversation_id, question):
+                return None, None
+            question_vector = self.retriever.embedder.embed_text(question).embeddings
+            cached_response = self.semantic_cache.get(question_vector)
         except Exception as e:
-            self.activity_logger.log_interaction(
-                f"Error during document retrieval for HyDE: {e}", "error")
-            return self.utils.construct_RAGResponse(
-                answer="",
-                error="Document retrieval for HyDE failed",
-                details=str(e)
-            )
-        # before reranking we need to merge the two sets of documents
-        merged_docs = self.utils.merge_two_ElasticsearchAnswer_lists(rewritten_docs, hyde_docs)
-
+            self.activity_logger.log_interaction(f"Error during semantic cache lookup: {e}", "error")
+            return None, None
+        if cached_response is None:
+            return question_vector, None
         try:
-            update_status("Reranking documents...")
-            if rewritten_question :
-                reranked_docs = self.reranker.rerank(
-                    rewritten_question.rewritten_question, merged_docs, top_n=2)
-            else:
-                reranked_docs = self.reranker.rerank(question, merged_docs, top_n=2)
-            # extract all content as a single list  of string
-            reranked_contents = [doc.source.get('content', '') for doc in reranked_docs.hits]
-            update_status(f"Reranked to {len(reranked_docs.hits)} documents.")
+            guard_response = self.validate_question(question)
         except Exception as e:
-            self.activity_logger.log_interaction(f"Error during document reranking: {e}", "error")
-            return self.utils.construct_RAGResponse(
+            # the graph runs the guard again and reports the failure like for any question
+            self.activity_logger.log_interaction(f"Error validating a cached question: {e}", "error")
+            return question_vector, None
+        if not guard_response.isSafe:
+            update_status(f"Question failed guardrails: {guard_response.reasons}")
+            return question_vector, self.utils.construct_RAGResponse(
                 answer="",
-                error="Document reranking failed",
-                details=str(e)
+                error="Question did not pass guardrails",
+                details=guard_response.reasons
             )
+        update_status("Answer found in semantic cache.")
+        return question_vector, cached_response
 
-        # finally the generation
-        try:
-            update_status("Generating final answer...")
+    def _cache_store(self, question: str, question_vector, response: RAGResponse):
+        # only complete answers are kept, never errors or guardrail rejections
+        if self.semantic_cache is None or question_vector is None:
+            return
+        if response.error or not response.answer or response.answer == GENERATION_ERROR_ANSWER:
+            return
+        self.semantic_cache.put(question, question_vector, response)
+        self.activity_logger.log_interaction(f"Semantic cache stats: {self.semantic_cache.stats()}", "info")
 
-            final_answer = self.qa_agent.answer(question, reranked_contents)
-            update_status("Final answer generated.")
+    def _status_updater(self, status_callback: Optional[Callable[[str], None]]) -> Callable[[str], None]:
+        def update_status(message: str):  # this will be used in front to display the state
+            """Helper to update status if callback is provided"""
+            if status_callback:
+                status_callback(message)
+            print(f"RAGPPELINE: {message}")
+        return update_status
+
+    def _run_graph(self,
+                   question: str,
+                   update_status: Callable[[str], None],
+                   with_generation: bool,
+                   mode: Optional[str] = None,
+                   conversation_id: Optional[str] = None) -> Dict[str, Any] | RAGResponse:
+        # returns the stage results, or the RAGResponse to send back when a stage stopped the graph
+        def on_stage_done(stage: str, seconds: float):
+            # called from the calling thread, so the callback can update the front
+            update_status(f"{STAGE_MESSAGES[stage][0]} ({seconds:.2f}s).")
 
-            final_response = self.utils.construct_RAGResponse(
-                answer=final_answer,
-                source_documents=reranked_docs
+        try:
+            update_status("Checking guardrails and rewriting question...")
+            results = self.build_graph(question, with_generation, mode, conversation_id).run(
+                self.executor, on_stage_done)
+            if "retrieve_raw" in results:
+                self._log_adaptive_decision(results)
+            return results
+        except StageCancelled as e:
+            update_status(f"Question failed guardrails: {e.reason}")
+            return self.utils.construct_RAGResponse(
+                answer="",
+                error="Question did not pass guardrails",
+                details=e.reason
             )
-            return final_response
-        except Exception as e:
-            self.activity_logger.log_interaction(f"Error during answer generation: {e}", "error")
+        except StageFailed as e:
+            self.activity_logger.log_interaction(f"Error during stage {e.stage}: {e.error}", "error")
+            update_status(f"Error during stage {e.stage}: {e.error}")
             return self.utils.construct_RAGResponse(
                 answer="",
-                error="Answer generation failed",
-                details=str(e)
+                error=STAGE_MESSAGES[e.stage][1],
+                details=str(e.error)
             )
+
+    def _log_timings(self, timings: Dict[str, float], total: float, update_status: Callable[[str], None]):
+        update_status(f"Pipeline done in {total:.2f}s (stages sum {sum(timings.values()):.2f}s).")
+        self.activity_logger.log_interaction(
+            "Stage timings: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()),
+            "info")
+        if AGENT_CACHE_ENABLED:
+            self.activity_logger.log_interaction(f"Agent cache stats: {get_agent_cache().stats()}", "info")
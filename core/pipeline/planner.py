@@ -0,0 +1,74 @@
+# one structured output agent doing the work of the guard, rewriter and HyDE agents,
+# used by RAGPipeline in "planner" mode to save two LLM round trips
+from core.types import PlannerAgentResponse
+from langchain.agents import create_agent
+from langchain.chat_models import init_chat_model
+from core.pipeline.prompts.planner import SYSTEM_PROMPT
+from core.config import PLANNER_MODEL_NAME
+from core.vector_store.logger import ActivityLogger
+from core.agent_cache import agent_cache_for, cached_call
+from typing import Optional
+
+
+class PlannerAgent:
+    def __init__(
+            self,
+            model_name=PLANNER_MODEL_NAME,
+            system_prompt=SYSTEM_PROMPT,
+            temperature=0.3,
+            use_cache: Optional[bool] = None):
+        self.model_name = model_name
+        self.system_prompt = system_prompt
+        self.temperature = temperature
+        self.cache = agent_cache_for("planner", use_cache)
+        self.agent = self._initialize_agent()
+        self.activity_logger = ActivityLogger("planner_agent")
+
+    def _initialize_agent(self):
+        try:
+            model = init_chat_model(
+                model=self.model_name,
+                temperature=self.temperature,
+                # the answer holds the rewritten question and the hypothetical answer
+                timeout=15,
+                max_tokens=800
+            )
+            return create_agent(
+                model=model,
+                system_prompt=self.system_prompt,
+                response_format=PlannerAgentResponse,
+                name="Planner Agent",
+            )
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error initializing Planner Agent: {e}", "error")
+            raise e
+
+    def plan(self, question: str) -> PlannerAgentResponse:
+        try:
+            response = cached_call(self.cache, (self.model_name, self.system_prompt, self.temperature, question),
+                                   "planner", PlannerAgentResponse, lambda: self._invoke(question))
+            if response is None:
+                return PlannerAgentResponse(isSafe=False, reasons="Invalid response structure")
+            return response
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error planning question: {e}", "error")
+            raise e
+
+    def _invoke(self, question: str) -> Optional[PlannerAgentResponse]:
+        # None when the response has no structured output, it is not cached
+        prompt = {
+            "messages": [{"role": "user", "content": f"{question}"}]
+        }
+        response = self.agent.invoke(prompt)  # type: ignore
+        # verify that structured_response is inside
+        if isinstance(response, dict) and 'structured_response' in response:
+            response = response['structured_response']
+            # an accepted question always gets something to search with
+            if response.isSafe and not response.rewritten_question:
+                response.rewritten_question = question
+            if response.isSafe and not response.hypothetical_answer:
+                response.hypothetical_answer = response.rewritten_question
+            return response
+        self.activity_logger.log_interaction(
+            f"Invalid response structure from planner agent: {response}", "error")
+        return None
@@ -1,63 +1,86 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
+import threading
+from typing import List
+import numpy as np
 from core.types import ElasticsearchAnswer
+from core.config import (RERANKER_MODEL_NAME, RERANKER_BACKEND, RERANKER_NUM_THREADS, RERANKER_INTEROP_THREADS,
+                         RERANKER_BATCH_SIZE, RERANKER_MAX_LENGTH)
+from core.model_backends import load_reranker_model
 from core.vector_store.logger import ActivityLogger
 
 
 class Reranker:
-    def __init__(self, model_name: str = "antoinelouis/crossencoder-camembert-base-mmarcoFR"):
+    def __init__(self,
+                 model_name: str = RERANKER_MODEL_NAME,
+                 backend: str = RERANKER_BACKEND,
+                 num_threads: int = RERANKER_NUM_THREADS,
+                 interop_threads: int = RERANKER_INTEROP_THREADS,
+                 batch_size: int = RERANKER_BATCH_SIZE,
+                 max_length: int = RERANKER_MAX_LENGTH):
         self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_length = max_length
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+            # imported there so that importing the pipeline does not pull torch and transformers
+            self.tokenizer, self.model = load_reranker_model(model_name, backend, num_threads, interop_threads)
         except Exception as e:
-            print(f"Error loading reranker model '{model_name}': {e}")
+            print(f"Error loading reranker model '{model_name}' ({backend}): {e}")
             raise e
+        # one instance is shared by every session (core/registry.py), a fast tokenizer must not be
+        # called from two threads at once
+        self.tokenizer_lock = threading.Lock()
         self.activity_logger = ActivityLogger("reranker")
 
-    def rerank(self, query: str, docs: ElasticsearchAnswer, top_n: int = 3):
+    def warm_up(self):
+        # one dummy forward pass, the first real query does not pay for it
+        self._scores("warm-up", ["warm-up"])
+
+    def _scores(self, query: str, contents: List[str]) -> np.ndarray:
+        import torch
+        if not contents:
+            return np.zeros(0, dtype=np.float32)
+        with self.tokenizer_lock:
+            encoded = self.tokenizer(
+                [query] * len(contents), contents,
+                truncation=True,  # pour couper les sequences trop longues
+                max_length=self.max_length
+            )
+        # the pairs are scored by micro-batches of similar lengths: a short document is no
+        # longer padded to the longest one
+        order = np.argsort([len(ids) for ids in encoded["input_ids"]], kind="stable")
+        scores = np.empty(len(contents), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            with self.tokenizer_lock:
+                inputs = self.tokenizer.pad(
+                    [{key: encoded[key][i] for key in encoded.keys()} for i in batch],
+                    return_tensors="pt"
+                )
+            with torch.no_grad():
+                # passe de [[ 0.8932],[-4.3728],[-2.2026]] a [0.8932,-4.3728,-2.2026]
+                scores[batch] = self.model(**inputs).logits.squeeze(-1).float().numpy()
+        return scores
+
+    def rerank(self, query: str, docs: ElasticsearchAnswer, top_n: int = 3) -> ElasticsearchAnswer:
+        # the returned hits carry their cross-encoder score in rerank_score
         try:
             if not docs or not docs.hits:
                 print("No documents to rerank.")
                 self.activity_logger.log_interaction("No documents to rerank.", "warning")
                 return ElasticsearchAnswer(hits=[])
-            # display title of documents in order before reranking
-
+            scores = self._scores(query, [doc.content for doc in docs.hits])
+            top_indices = np.argsort(-scores, kind="stable")[:min(top_n, len(docs.hits))]
+            reranked_hits = [docs.hits[i].model_copy(update={"rerank_score": float(scores[i])})
+                             for i in top_indices]
             try:
                 print("RERANKER: Documents before reranking:")
                 for doc in docs.hits:
-                    title = doc.source.get('doc_title', 'No Title')
-                    print(f"RERANKER: Title: {title}, Score: {doc.score}")
-            except Exception as e:
-                self.activity_logger.log_interaction(
-                    f"Error logging document titles before reranking: {e}", "error")
-
-            # Extract content from each document
-            doc_contents = [doc.source.get('content', '') for doc in docs.hits]
-            pairs = [(query, content) for content in doc_contents]
-            inputs = self.tokenizer(
-                pairs,
-                padding=True, # pour que toutes les sequences aient la meme longueur
-                truncation=True, # pour couper les sequences trop longues
-                return_tensors="pt",
-                max_length=512
-            )
-
-            with torch.no_grad():
-                scores = self.model(**inputs).logits.squeeze(-1) # passe de [[ 0.8932],[-4.3728],[-2.2026]] a [0.8932,-4.3728,-2.2026]
-            k = min(top_n, len(docs.hits))
-            top_indices = torch.topk(scores, k).indices
-            # Return only the top n documents
-            reranked_hits = [docs.hits[i] for i in top_indices]
-            # display title of documents in order after reranking
-            try:
+                    print(f"RERANKER: Title: {doc.title}, Score: {doc.score}")
                 print("RERANKER: Documents after reranking:")
                 for doc in reranked_hits:
-                    title = doc.source.get('doc_title', 'No Title')
-                    print(f"RERANKER: Title: {title}, Score: {scores[docs.hits.index(doc)].item()}")
+                    print(f"RERANKER: Title: {doc.title}, Score: {doc.rerank_score}")
             except Exception as e:
-                self.activity_logger.log_interaction(
-                    f"Error logging document titles after reranking: {e}", "error")
+                self.activity_logger.log_interaction(f"Error logging reranked document titles: {e}", "error")
             return ElasticsearchAnswer(hits=reranked_hits)
         except Exception as e:
             self.activity_logger.log_interaction(f"Error during reranking: {e}", "error")
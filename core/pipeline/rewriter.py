@@ -6,6 +6,8 @@ from langchain.chat_models import init_chat_model
 from core.pipeline.prompts.rewriter import SYSTEM_PROMPT
 from core.config import REWRITER_MODEL_NAME
 from core.vector_store.logger import ActivityLogger
+from core.agent_cache import agent_cache_for, cached_call
+from typing import Optional
 
 
 class RewriterAgent:
@@ -14,10 +16,12 @@ class RewriterAgent:
             self,
             model_name=REWRITER_MODEL_NAME,
             system_prompt=SYSTEM_PROMPT,
-            temperature=0.5):
+            temperature=0.5,
+            use_cache: Optional[bool] = None):
         self.model_name = model_name
         self.system_prompt = system_prompt
         self.temperature = temperature
+        self.cache = agent_cache_for("rewriter", use_cache)
         self.agent = self._initialize_agent()
         self.activity_logger = ActivityLogger("rewriter")
 
@@ -41,19 +45,25 @@ class RewriterAgent:
 
     def rewrite_question(self, question: str) -> RewriterAgentResponse:
         try:
-            prompt = {
-                "messages": [{"role": "user", "content": f"{question}"}]
-            }
-            response = self.agent.invoke(prompt)  # type: ignore
-            # verify that structured_response is inside
-            if isinstance(response, dict) and 'structured_response' in response:
-                response = response['structured_response']
-                return response
-            else:
-                self.activity_logger.log_interaction(
-                    f"Invalid response structure from rewriter agent: {response}", "error")
+            response = cached_call(self.cache, (self.model_name, self.system_prompt, self.temperature, question),
+                                   "rewriter", RewriterAgentResponse, lambda: self._invoke(question))
+            if response is None:
                 return RewriterAgentResponse(
                     **{"neededRewrite": False, "rewritten_question": "Invalid response structure"})
+            return response
         except Exception as e:
             self.activity_logger.log_interaction(f"Error rewriting question: {e}", "error")
             raise e
+
+    def _invoke(self, question: str) -> Optional[RewriterAgentResponse]:
+        # None when the response has no structured output, it is not cached
+        prompt = {
+            "messages": [{"role": "user", "content": f"{question}"}]
+        }
+        response = self.agent.invoke(prompt)  # type: ignore
+        # verify that structured_response is inside
+        if isinstance(response, dict) and 'structured_response' in response:
+            return response['structured_response']
+        self.activity_logger.log_interaction(
+            f"Invalid response structure from rewriter agent: {response}", "error")
+        return None
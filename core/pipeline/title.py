@@ -4,13 +4,17 @@ from langchain.chat_models import init_chat_model
 from core.pipeline.prompts.title import SYSTEM_PROMPT
 from core.config import TITLE_MODEL_NAME
 from core.vector_store.logger import ActivityLogger
+from core.agent_cache import agent_cache_for, cached_call
+from typing import Optional
 
 
 class TitleAgent:
-    def __init__(self, model_name=TITLE_MODEL_NAME, system_prompt=SYSTEM_PROMPT, temperature=0.7):
+    def __init__(self, model_name=TITLE_MODEL_NAME, system_prompt=SYSTEM_PROMPT, temperature=0.7,
+                 use_cache: Optional[bool] = None):
         self.model_name = model_name
         self.system_prompt = system_prompt
         self.temperature = temperature
+        self.cache = agent_cache_for("title", use_cache)
         self.agent = self._initialize_agent()
         self.activity_logger = ActivityLogger("title_agent")
 
@@ -34,18 +38,24 @@ class TitleAgent:
 
     def create_title(self, question: str) -> TitleAgentResponse:
         try:
-            prompt = {
-                "messages": [{"role": "user", "content": f"{question}"}]
-            }
-            response = self.agent.invoke(prompt)  # type: ignore
-            # verify that structured_response is inside
-            if isinstance(response, dict) and 'structured_response' in response:
-                response = response['structured_response']
-                return response
-            else:
-                self.activity_logger.log_interaction(
-                    f"Invalid response structure from title agent: {response}", "error")
+            response = cached_call(self.cache, (self.model_name, self.system_prompt, self.temperature, question),
+                                   "title", TitleAgentResponse, lambda: self._invoke(question))
+            if response is None:
                 return TitleAgentResponse(**{"Titre": "Invalid response structure"})
+            return response
         except Exception as e:
             self.activity_logger.log_interaction(f"Error creating title: {e}", "error")
             raise e
+
+    def _invoke(self, question: str) -> Optional[TitleAgentResponse]:
+        # None when the response has no structured output, it is not cached
+        prompt = {
+            "messages": [{"role": "user", "content": f"{question}"}]
+        }
+        response = self.agent.invoke(prompt)  # type: ignore
+        # verify that structured_response is inside
+        if isinstance(response, dict) and 'structured_response' in response:
+            return response['structured_response']
+        self.activity_logger.log_interaction(
+            f"Invalid response structure from title agent: {response}", "error")
+        return None
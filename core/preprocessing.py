@@ -1,43 +1,94 @@
-from typing import Dict
+from typing import Dict, Iterator, List
+from html.parser import HTMLParser
 import pandas as pd
+import hashlib
+import json
 import os
+import time
 import re
 import datetime
+from core.chunking import Chunker
+from core.config import READ_BLOCK_SIZE, CSV_CHUNK_ROWS
 from core.vector_store.logger import ActivityLogger
 
+SUPPORTED_EXTENSIONS = ('.txt', '.csv', '.html')
+
+
+def document_key(file_path: str) -> str:
+    # a.txt and a.csv share their doc_title, the chunk ids and the clean file keep the extension
+    return os.path.basename(file_path)
+
+
+def clean_file_name(file_path: str) -> str:
+    return f"{document_key(file_path)}.jsonl"
+
+
+class _HTMLTextExtractor(HTMLParser):
+    # incremental parser: feed() can be called block by block, text is drained after each feed
+    SKIPPED_TAGS = {"script", "style", "head", "noscript"}
+    BLOCK_TAGS = {"p", "div", "br", "li", "tr", "section", "article", "h1", "h2", "h3", "h4",
+                  "h5", "h6", "table", "ul", "ol", "blockquote", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def drain(self) -> str:
+        text = "".join(self.parts)
+        self.parts = []
+        return text
+
 
 class Preprocessor:
     def __init__(self, raw_path: str, clean_path: str):
         self.raw_path = raw_path  # maybe not needed
         self.clean_path = clean_path
+        self.chunker = Chunker()
         self.activity_logger = ActivityLogger("preprocessor")
 
-    # Process file
+    # Process file, chunks are written one per line to clean_path/<document_key>.jsonl
     def process_file(self, file_path: str) -> str:
-        try :  # Detect file type
+        tmp_file_path = ""
+        try :
             print(f"PREPROCESSING: Preprocessing file: {file_path}")
-            json_result = None
-            if file_path.endswith('.csv'):
-                json_result = self._process_csv(file_path)
-            elif file_path.endswith('.html'):
-                json_result = self._process_html(file_path)
-            elif file_path.endswith('.txt'):
-                json_result = self._process_txt(file_path)
-
-            # save file type to clean_path
-            if json_result:
-                doc_title = json_result['doc_title']
-                clean_file_path = os.path.join(self.clean_path, f"{doc_title}.json")
-                with open(clean_file_path, 'w', encoding='utf-8') as f:
-                    import json
-                    json.dump(json_result, f, ensure_ascii=False, indent=4)
-                print(f"PREPROCESSING: Processed and saved: {clean_file_path}")
+            clean_file_path = os.path.join(self.clean_path, clean_file_name(file_path))
+            tmp_file_path = clean_file_path + ".tmp"
+            nb_chunks = 0
+            with open(tmp_file_path, 'w', encoding='utf-8') as f:
+                for chunk in self.iter_chunks(file_path):
+                    f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+                    nb_chunks += 1
+
+            if nb_chunks:
+                os.replace(tmp_file_path, clean_file_path)
+                print(f"PREPROCESSING: Processed and saved {nb_chunks} chunks: {clean_file_path}")
                 return clean_file_path
             else:
+                os.remove(tmp_file_path)
                 self.activity_logger.log_interaction(
                     f"Skipping empty or invalid file: {file_path}", "warning")
                 return ""
         except Exception as e:
+            # the previous clean file, if any, is left as it was
+            if tmp_file_path and os.path.exists(tmp_file_path):
+                os.remove(tmp_file_path)
             self.activity_logger.log_interaction(f"Error processing file {file_path}: {e}", "error")
             raise e
 
@@ -45,7 +96,7 @@ class Preprocessor:
     def process_folder(self, folder_path: str):
         try :
             fnames = [os.path.join(folder_path, x) for x in os.listdir(
-                folder_path) if x.endswith('.txt') or x.endswith('.csv') or x.endswith('.html')]
+                folder_path) if x.endswith(SUPPORTED_EXTENSIONS)]
             for fname in fnames:
                 self.process_file(fname)
         except Exception as e:
@@ -53,100 +104,95 @@ class Preprocessor:
                 f"Error processing folder {folder_path}: {e}", "error")
             raise e
 
-    def _process_csv(self, file_path: str) -> Dict:
-        try:
-            df = pd.read_csv(file_path, encoding='utf-8')
-            df = df.dropna(axis=1, how='all')
-            df = df.drop_duplicates()
-
-            # here I will add a step to truncate the content if too long but in the
-            # funture we could chunk documents
-            if len(df) > 20:
-                df = df.head(20)
-            json_data = df.to_dict(orient='records')
-            date = self._extract_date(str(json_data))
-            doc_title = os.path.splitext(os.path.basename(file_path))[0]
-            json_result = {
-                "doc_title": doc_title,
-                "content": json_data,
-                "metadata": {
+    def iter_chunks(self, file_path: str) -> Iterator[Dict]:
+        # Detect file type
+        rows = file_path.endswith('.csv')
+        if rows:
+            blocks = self._read_csv(file_path)
+        elif file_path.endswith('.html'):
+            blocks = self._read_html(file_path)
+        elif file_path.endswith('.txt'):
+            blocks = self._read_txt(file_path)
+        else:
+            return
+
+        doc_title = os.path.splitext(os.path.basename(file_path))[0]
+        key = document_key(file_path)
+        metadata = None
+        for chunk in self.chunker.chunk_blocks(blocks, rows=rows):
+            if metadata is None:
+                # the date of the document is looked for at its beginning
+                metadata = {
                     "source": file_path,
-                    "date": date,
+                    "date": self._extract_date(chunk["content"]),
                     "modified": datetime.datetime.now().strftime("%Y-%m-%d")
                 }
+            yield {
+                "chunk_id": f"{key}-{chunk['chunk_index']}",
+                "doc_title": doc_title,
+                **chunk,
+                "metadata": metadata
             }
-            print(f"PREPROCESSING: Processed CSV file: {file_path}")
-            return json_result
+
+    def _read_csv(self, file_path: str) -> Iterator[str]:
+        try:
+            start = time.perf_counter()
+            seen_rows = set()  # 8 bytes hashes of the rows already yielded
+            nb_rows, nb_duplicates = 0, 0
+            # dtype=str keeps values as written and the same types from one chunk to another
+            reader = pd.read_csv(file_path, encoding='utf-8', dtype=str, chunksize=CSV_CHUNK_ROWS)
+            for df in reader:
+                rows = []
+                columns = list(df.columns)
+                for values in df.itertuples(index=False, name=None):
+                    nb_rows += 1
+                    row_hash = hashlib.blake2b(
+                        "\x1f".join(str(v) for v in values).encode('utf-8'), digest_size=8).digest()
+                    if row_hash in seen_rows:
+                        nb_duplicates += 1
+                        continue
+                    seen_rows.add(row_hash)
+                    # one paragraph per row, the chunker keeps a row whole (Chunker.chunk_blocks with
+                    # rows=True) so a blank line inside a value must not end it; the column names
+                    # are kept so that each chunk is readable on its own
+                    rows.append("; ".join(
+                        f"{k}: {' '.join(v.split())}" for k, v in zip(columns, values) if pd.notna(v)) + "\n\n")
+                yield "".join(rows)
+            elapsed = time.perf_counter() - start
+            self.activity_logger.log_interaction(
+                f"Processed CSV file {file_path}: {nb_rows} rows ({nb_duplicates} duplicates) "
+                f"in {elapsed:.2f}s, {nb_rows / max(elapsed, 1e-9):.0f} rows/sec", "info")
         except Exception as e:
+            # a file read in part must not be indexed as complete
             self.activity_logger.log_interaction(
                 f"Error processing CSV file {file_path}: {e}", "error")
-            return {}
+            raise e
 
-    def _process_html(self, file_path: str) -> Dict:
+    def _read_html(self, file_path: str) -> Iterator[str]:
         try:
+            parser = _HTMLTextExtractor()
             with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            # Verify if content is empty
-            if not content.strip():
-                print(f"Warning: The file {file_path} is empty.")
-                return {}
-            # Remove script and style tags
-            content = re.sub(r'<script[^>]*>.*?</script>', '', content, flags=re.DOTALL)
-            content = re.sub(r'<style[^>]*>.*?</style>', '', content, flags=re.DOTALL)
-            # truncate the content if too long
-            if len(content) > 800:
-                content = content[:800]
-            date = self._extract_date(content)
-            doc_title = os.path.splitext(os.path.basename(file_path))[0]
-            json_result = {
-                "doc_title": doc_title,
-                "content": content,
-                "metadata": {
-                    "source": file_path,
-                    "date": date,
-                    "modified": datetime.datetime.now().strftime("%Y-%m-%d")
-                }
-            }
+                while block := f.read(READ_BLOCK_SIZE):
+                    parser.feed(block)
+                    yield parser.drain()
+            parser.close()
+            yield parser.drain()
             print(f"PREPROCESSING: Processed HTML file: {file_path}")
-            return json_result
         except Exception as e:
             self.activity_logger.log_interaction(
                 f"Error processing HTML file {file_path}: {e}", "error")
-            return {}
+            raise e
 
-    def _process_txt(self, file_path: str) -> Dict:
+    def _read_txt(self, file_path: str) -> Iterator[str]:
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            # Verify if content is empty
-            if not content.strip():
-                print(f"Warning: The file {file_path} is empty.")
-                return {}
-
-            # remove extra new lines and spaces
-            content = re.sub(r'\n\s*\n', '\n\n', content)
-            content = content.strip()
-            if len(content) > 800:
-                content = content[:800]
-
-            date = self._extract_date(content)
-            doc_title = os.path.splitext(os.path.basename(file_path))[0]
-
-            json_result = {
-                "doc_title": doc_title,
-                "content": content,
-                "metadata": {
-                    "source": file_path,
-                    "date": date,
-                    "modified": datetime.datetime.now().strftime("%Y-%m-%d")
-                }
-            }
-            return json_result
+                while block := f.read(READ_BLOCK_SIZE):
+                    yield block
             print(f"PREPROCESSING: Processed TXT file: {file_path}")
         except Exception as e:
             self.activity_logger.log_interaction(
                 f"Error processing TXT file {file_path}: {e}", "error")
-            return {}
+            raise e
 
     def _extract_date(self, text: str) -> str:
         try:
@@ -158,3 +204,14 @@ class Preprocessor:
         except Exception as e:
             self.activity_logger.log_interaction(f"Error extracting date from text: {e}", "error")
             return ""
+
+
+# used by the process pool of DocumentsManager.process_folder, one Preprocessor per worker
+_worker_preprocessor = None
+
+
+def preprocess_file_in_worker(raw_path: str, clean_path: str, file_path: str) -> str:
+    global _worker_preprocessor
+    if _worker_preprocessor is None or _worker_preprocessor.clean_path != clean_path:
+        _worker_preprocessor = Preprocessor(raw_path=raw_path, clean_path=clean_path)
+    return _worker_preprocessor.process_file(file_path)
@@ -0,0 +1,94 @@
+# process-wide registry of the heavy objects: the models are loaded once and shared by every
+# Streamlit session, the conversation state lives in the session and in the History indices
+import threading
+import time
+from typing import Any, Dict, TYPE_CHECKING
+from core.config import EMBEDDINGS_MODEL_NAME, RERANKER_MODEL_NAME
+
+if TYPE_CHECKING:  # the modules are imported on first use, they import the registry themselves
+    from core.embeddings import Embedder
+    from core.pipeline.pipeline import RAGPipeline
+    from core.pipeline.reranker import Reranker
+    from core.vector_store.history import History
+
+_embedders: Dict[str, "Embedder"] = {}
+_rerankers: Dict[str, "Reranker"] = {}
+_pipeline = None
+_history = None
+# one lock per object: the page must get History while the warm-up thread builds the pipeline
+_embedders_lock = threading.Lock()
+_rerankers_lock = threading.Lock()
+_pipeline_lock = threading.Lock()
+_history_lock = threading.Lock()
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+_warmup_status: Dict[str, Any] = {"state": "not started", "timings": {}, "error": None}
+
+
+def get_embedder(model_name: str = EMBEDDINGS_MODEL_NAME) -> "Embedder":
+    from core.embeddings import Embedder
+    with _embedders_lock:
+        if model_name not in _embedders:
+            _embedders[model_name] = Embedder(model_name)
+        return _embedders[model_name]
+
+
+def get_reranker(model_name: str = RERANKER_MODEL_NAME) -> "Reranker":
+    from core.pipeline.reranker import Reranker
+    with _rerankers_lock:
+        if model_name not in _rerankers:
+            _rerankers[model_name] = Reranker(model_name)
+        return _rerankers[model_name]
+
+
+def get_history() -> "History":
+    # History keeps no per-conversation state, the conversation id is passed to every call
+    from core.vector_store.history import History
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = History()
+        return _history
+
+
+def get_pipeline() -> "RAGPipeline":
+    from core.pipeline.pipeline import RAGPipeline
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = RAGPipeline()
+        return _pipeline
+
+
+def _warm_up():
+    # imports, model loading and one dummy encode/rerank, each step timed for warmup_status()
+    timings = _warmup_status["timings"]
+    try:
+        for step, function in (
+                ("pipeline", get_pipeline),
+                ("embedder", lambda: get_embedder().warm_up()),
+                ("reranker", lambda: get_reranker().warm_up())):
+            start = time.perf_counter()
+            function()
+            timings[step] = time.perf_counter() - start
+        _warmup_status["state"] = "done"
+        print(f"REGISTRY: warm-up done {({step: round(seconds, 2) for step, seconds in timings.items()})}")
+    except Exception as e:
+        _warmup_status["state"] = "error"
+        _warmup_status["error"] = str(e)
+        print(f"REGISTRY: warm-up failed: {e}")
+
+
+def start_warmup():
+    # loads everything in a background thread so that the page is displayed meanwhile,
+    # a query sent before the end waits for the objects it needs
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_status["state"] = "running"
+            _warmup_thread = threading.Thread(target=_warm_up, name="warm-up", daemon=True)
+            _warmup_thread.start()
+
+
+def warmup_status() -> Dict[str, Any]:
+    return dict(_warmup_status)
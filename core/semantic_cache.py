@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from core.types import RAGResponse
+from core.config import (SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+                         SEMANTIC_CACHE_TTL_SECONDS)
+
+
+class SemanticCache:
+    # answers of past questions, found back by cosine similarity of the question embeddings;
+    # the normalised vectors are rows of one preallocated matrix so a lookup is a single matmul
+    def __init__(self,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.matrix: Optional[np.ndarray] = None  # (max_entries, dimension), allocated at first put
+        self.active = np.zeros(max_entries, dtype=bool)
+        self.entries: "OrderedDict[int, Dict]" = OrderedDict()  # row -> entry, in LRU order
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalise(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector) -> Optional[RAGResponse]:
+        with self.lock:
+            self._expire()
+            if self.matrix is None or not self.entries:
+                self.misses += 1
+                return None
+            similarities = np.where(self.active, self.matrix @ self._normalise(vector), -1.0)
+            row = int(np.argmax(similarities))
+            if similarities[row] < self.threshold:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(row)
+            self.hits += 1
+            entry = self.entries[row]
+            print(f"SEMANTIC CACHE: hit ({similarities[row]:.3f}) with \"{entry['question']}\"")
+            return entry["response"]
+
+    def put(self, question: str, vector, response: RAGResponse):
+        # the documents cited by the answer are kept to invalidate it when one of them changes,
+        # chunk ids are "<document key>-<chunk index>" (see preprocessing.document_key)
+        documents = {hit.id.rsplit("-", 1)[0] for answer in response.source_documents or [] for hit in answer.hits}
+        vector = self._normalise(vector)
+        with self.lock:
+            if self.matrix is None:
+                self.matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._expire()
+            if len(self.entries) >= self.max_entries:
+                row, _ = self.entries.popitem(last=False)  # least recently used
+                self.active[row] = False
+                self.evictions += 1
+            row = int(np.argmin(self.active))  # first free row
+            self.matrix[row] = vector
+            self.active[row] = True
+            self.entries[row] = {
+                "question": question,
+                "response": response,
+                "documents": documents,
+                "created_at": time.time()
+            }
+
+    def invalidate_documents(self, document_keys: Iterable[str]) -> int:
+        # drops every answer citing one of the documents, called when they are re-indexed or deleted
+        document_keys = set(document_keys)
+        with self.lock:
+            rows = [row for row, entry in self.entries.items() if entry["documents"] & document_keys]
+            self._remove(rows)
+            self.invalidations += len(rows)
+        if rows:
+            print(f"SEMANTIC CACHE: {len(rows)} answers invalidated")
+        return len(rows)
+
+    def clear(self):
+        with self.lock:
+            self._remove(list(self.entries))
+
+    def _expire(self):
+        # entries are in LRU order, not creation order, so every entry is checked
+        limit = time.time() - self.ttl_seconds
+        self._remove([row for row, entry in self.entries.items() if entry["created_at"] < limit])
+
+    def _remove(self, rows: List[int]):
+        for row in rows:
+            del self.entries[row]
+            self.active[row] = False
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    # one cache per process, shared by the pipelines of every session and by DocumentsManager
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SemanticCache()
+        return _shared_cache
@@ -1,7 +1,10 @@
 # this will be called when launchin app to verify that everithing is setup
+# python -m core.setup --reindex rebuilds the document index by hand
+import argparse
 import os
+import sys
 from core.vector_store.documents_manager import DocumentsManager
-from core.vector_store.history import History
+from core.registry import get_history
 from core.config import DOCUMENTS_INDEX_NAME, HISTORY_INDEX_NAME, MESSAGE_INDEX_NAME
 from core.vector_store.logger import ActivityLogger
 
@@ -15,7 +18,7 @@ class Setup:
         self.message_index_name = MESSAGE_INDEX_NAME
         self.activity_logger = ActivityLogger(source="setup")
 
-    def verify_setup(self) -> bool:
+    def verify_setup(self, reindex: bool = False) -> bool:
         try:
             print("SETUP: Verifying logger setup")
             if self.activity_logger.es_client.verify_index(self.activity_logger.logger_index_name):
@@ -31,50 +34,43 @@ class Setup:
             print("SETUP: Verifying document setup")
             os.makedirs(self.raw_folder, exist_ok=True)
             os.makedirs(self.clean_folder, exist_ok=True)
-            raw_fnames = [os.path.join(self.raw_folder, x) for x in os.listdir(
-                self.raw_folder) if x.endswith('.txt') or x.endswith('.csv') or x.endswith('.html')]
-            clean_fnames = [
-                os.path.join(
-                    self.clean_folder,
-                    x) for x in os.listdir(
-                    self.clean_folder) if x.endswith('.json')]
-
-            if len(raw_fnames) != len(clean_fnames) :
-                print("SETUP: Initializing DocumentsManager...")
-                doc_manager = DocumentsManager(
-                    raw_path="data/raw",
-                    clean_path="data/clean"
-                )
-                print("SETUP: DocumentsManager initialized successfully")
-                print("SETUP: Verify that document index as been created...")
-                if doc_manager.es_client.verify_index(self.documents_index_name):
-                    print("SETUP: Document index exist")
-                else :
-                    print("SETUP: Document index does not exist")
-                    doc_manager.create_document_index()
-                print("SETUP: Starting to process folder...")
-                doc_manager.process_folder("documents_index", "data/raw")
+            # the embedding model is only loaded if a file has to be indexed
+            print("SETUP: Initializing DocumentsManager...")
+            doc_manager = DocumentsManager(
+                raw_path=self.raw_folder,
+                clean_path=self.clean_folder
+            )
+            print("SETUP: Verify that document index as been created...")
+            if doc_manager.es_client.verify_index(self.documents_index_name):
+                print("SETUP: Document index exist")
+                # an index created by an older version keeps its mapping: chunk_id mapped as text by
+                # the dynamic mapping would make the stale chunks deletion remove the new chunks too,
+                # and the HNSW options (m, ef_construction, type) and the french analyzer of content
+                # and doc_title only apply to a new index
+                differences = doc_manager.document_index_differences()
+                if differences or reindex:
+                    reason = f"mapping is outdated ({', '.join(differences)})" if differences else "reindex requested"
+                    self.activity_logger.log_interaction(f"Document index {reason}, recreating it", "warning")
+                    doc_manager.recreate_document_index()
+            else :
+                print("SETUP: Document index does not exist")
+                doc_manager.create_document_index()
+                # new empty index, every file has to be indexed again
+                doc_manager.manifest.clear()
+            # only new, modified and removed files are processed (see IngestionManifest)
+            print("SETUP: Syncing raw folder with the index...")
+            result = doc_manager.sync_folder(self.documents_index_name, self.raw_folder)
+            if result["changed"] or result["removed"]:
+                print(f"SETUP: {result['changed']} files indexed, {result['removed']} files removed")
             else:
-                
                 print("SETUP: Documents already processed.")
-                print("SETUP: Verify that document index as been created...")
-                doc_manager = DocumentsManager(
-                    raw_path="data/raw",
-                    clean_path="data/clean"
-                )
-                if doc_manager.es_client.verify_index(self.documents_index_name):
-                    print("SETUP: Document index exist")
-                else :
-                    print("SETUP: Document index does not exist")
-                    doc_manager.create_document_index()
-                
         except Exception as e:
             self.activity_logger.log_interaction(f"documents processing error : {e}", "error")
             return False
 
         try :
             print("SETUP: Verifying history setup")
-            history_manager = History()
+            history_manager = get_history()
             if history_manager.es_client.verify_index(self.history_index_name):
                 print("SETUP: history index exist")
             else :
@@ -90,3 +86,15 @@ class Setup:
             self.activity_logger.log_interaction(f"error : {e}", "error")
             return False
         return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="verifies the indices and indexes the raw folder")
+    parser.add_argument("--reindex", action="store_true",
+                        help="recreates the document index and indexes every raw file again")
+    args = parser.parse_args()
+    sys.exit(0 if Setup().verify_setup(reindex=args.reindex) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+import numpy as np
 
 
 class DocumentMetadata(BaseModel):
@@ -18,6 +19,10 @@ class Document(BaseModel):
     embeddings: List[float]
     metadata: DocumentMetadata
     indexed_at: Optional[datetime]
+    chunk_id: Optional[str] = None
+    chunk_index: Optional[int] = None
+    start_offset: Optional[int] = None
+    end_offset: Optional[int] = None
 
 
 class EmbeddingsMetadata(BaseModel):
@@ -32,6 +37,22 @@ class Embeddings(BaseModel):
     metadata: EmbeddingsMetadata
 
 
+class EmbeddingsBatch(BaseModel):
+    # row i of the contiguous float32 matrix is the vector of texts[i]
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    texts: List[str]
+    vectors: np.ndarray
+    metadata: EmbeddingsMetadata
+
+
+class DocumentBatch(BaseModel):
+    # documents are the _source of the chunks without their vector, stored in vectors[i]
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    ids: List[Optional[str]]
+    documents: List[Dict[str, Any]]
+    vectors: np.ndarray
+
+
 class GuardAgentResponse(BaseModel):
     isSafe: bool
     reasons: str | None = None
@@ -46,18 +67,34 @@ class HyDEAgentResponse(BaseModel):
     hypothetical_answer: str
 
 
+class PlannerAgentResponse(BaseModel):
+    # guard, rewrite and HyDE answered by a single call
+    isSafe: bool
+    reasons: str | None = None
+    rewritten_question: str = ""
+    hypothetical_answer: str = ""
+
+
 class ElasticsearchAnswerItem(BaseModel):
+    # light hit: source is only filled with the fields explicitly requested by the caller
     index: str
     id: str
     score: float
-    source: Dict[str, Any]
     title: str
+    content: str = ""
+    source: Dict[str, Any] = Field(default_factory=dict)
+    rerank_score: Optional[float] = None  # cross-encoder score, set by Reranker.rerank
 
 
 class ElasticsearchAnswer(BaseModel):
     hits: List[ElasticsearchAnswerItem]
 
 
+# error of a RAGResponse whose generation broke off: the tokens already streamed are not an
+# answer, it is neither cached nor saved to History
+GENERATION_FAILED_ERROR = "Answer generation failed"
+
+
 class RAGResponse(BaseModel):
     answer: str
     source_documents: Optional[List[ElasticsearchAnswer]] = None
@@ -65,5 +102,12 @@ class RAGResponse(BaseModel):
     details: Optional[str] = None
 
 
+class RAGStreamEvent(BaseModel):
+    # "token": a piece of the answer, "final": the complete RAGResponse (sources or error)
+    type: str
+    token: str = ""
+    response: Optional[RAGResponse] = None
+
+
 class TitleAgentResponse(BaseModel):
     title: str
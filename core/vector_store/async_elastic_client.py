@@ -0,0 +1,204 @@
+# asyncio variant of ElasticClient, the sync ElasticClient stays the facade used by existing callers
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Any, Coroutine, Dict, List, Optional, TypeVar
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_bulk
+from core.types import Document, DocumentBatch
+from core.vector_store.elastic_client import ElasticClient
+from core.config import (ES_HOSTS, ES_CONNECTIONS_PER_NODE, ES_REQUEST_TIMEOUT, ES_MAX_RETRIES,
+                         ES_RETRY_ON_TIMEOUT)
+
+# an AsyncElasticsearch client (and its aiohttp session) belongs to the event loop it was used on:
+# loop -> hosts -> client, an entry goes away with its loop; the sessions are only closed by
+# close_async_es_clients(), to await before the loop stops (run_with_async_es_clients does it)
+_async_es_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncElasticsearch]]" = \
+    weakref.WeakKeyDictionary()
+_async_es_clients_lock = threading.Lock()
+
+T = TypeVar("T")
+
+
+def get_async_es_client(hosts: str = ES_HOSTS) -> AsyncElasticsearch:
+    loop = asyncio.get_running_loop()
+    with _async_es_clients_lock:
+        clients = _async_es_clients.get(loop)
+        if clients is None:
+            clients = _async_es_clients[loop] = {}
+        if hosts not in clients:
+            # aiohttp is an optional dependency of elasticsearch, only needed by the async layer
+            if importlib.util.find_spec("aiohttp") is None:
+                raise ImportError("AsyncElasticsearch needs aiohttp: pip install 'elasticsearch[async]'")
+            clients[hosts] = AsyncElasticsearch(
+                hosts=hosts,
+                verify_certs=False,
+                connections_per_node=ES_CONNECTIONS_PER_NODE,
+                request_timeout=ES_REQUEST_TIMEOUT,
+                max_retries=ES_MAX_RETRIES,
+                retry_on_timeout=ES_RETRY_ON_TIMEOUT
+            )
+        return clients[hosts]
+
+
+async def _close_clients(clients: Dict[str, AsyncElasticsearch]):
+    await asyncio.gather(*(client.close() for client in clients.values()), return_exceptions=True)
+
+
+async def close_async_es_clients():
+    # closes the clients of the running loop
+    loop = asyncio.get_running_loop()
+    with _async_es_clients_lock:
+        clients = _async_es_clients.pop(loop, {})
+    await _close_clients(clients)
+
+
+def run_with_async_es_clients(coroutine: Coroutine[Any, Any, T]) -> T:
+    # asyncio.run that closes the clients opened by the coroutine before closing its loop
+    async def run_then_close() -> T:
+        try:
+            return await coroutine
+        finally:
+            await close_async_es_clients()
+
+    return asyncio.run(run_then_close())
+
+
+class AsyncElasticClient:
+    def __init__(self, hosts: str = ES_HOSTS):
+        self.hosts = hosts
+        # search bodies and bulk actions are built by the sync client, only the I/O differs
+        self.sync_client = ElasticClient(hosts)
+
+    @property
+    def es(self) -> AsyncElasticsearch:
+        return get_async_es_client(self.hosts)
+
+    async def verify_index(self, index_name: str) -> bool:
+        return bool(await self.es.indices.exists(index=index_name))
+
+    async def index_document(
+            self,
+            index_name: str,
+            document: Document | Dict[str, Any],
+            document_id: Optional[str] = None) -> bool:
+        body = document.model_dump() if isinstance(document, Document) else document
+        await self.es.index(index=index_name, document=body, id=document_id)
+        return True
+
+    async def bulk_index_batch(self, index_name: str, batch: DocumentBatch) -> int:
+        nb_indexed, errors = await async_bulk(
+            self.es, ElasticClient.batch_actions(index_name, batch), raise_on_error=False)
+        if errors:
+            print(f"ES: Errors in async bulk: {errors[:3]}")
+        return nb_indexed
+
+    async def bulk(self, actions: List[Dict[str, Any]]) -> int:
+        nb_indexed, _ = await async_bulk(self.es, actions, raise_on_error=False)
+        return nb_indexed
+
+    async def search(self, index_name: str, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        response = await self.es.search(index=index_name, body=body)
+        return response["hits"]["hits"]
+
+    async def msearch(self, index_name: str, bodies: List[Dict]) -> List[List[Dict[str, Any]]]:
+        searches: List[Dict] = []
+        for body in bodies:
+            searches.extend([{"index": index_name}, body])
+        response = await self.es.msearch(searches=searches)
+        results = []
+        for item in response["responses"]:
+            if "error" in item:
+                print(f"ES: Error in async msearch: {item['error']}")
+                results.append([])
+            else:
+                results.append(item["hits"]["hits"])
+        return results
+
+    async def retrieve(
+            self,
+            index_name: str,
+            mode: str,
+            query_text: str,
+            query_embedding: List[float],
+            top_k: int = 5,
+            options: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+        bodies = self.sync_client.build_search_bodies(
+            mode, query_text, query_embedding, top_k, options, projection)
+        try:
+            results = await self.msearch(index_name, bodies)
+            return self.sync_client.merge_search_results(mode, results, top_k, options)
+        except Exception as e:
+            print(f"ES: Error during async {mode} search: {e}")
+            return []
+
+    async def delete_document(self, index_name: str, document_id: str) -> bool:
+        try:
+            await self.es.delete(index=index_name, id=document_id)
+            return True
+        except Exception as e:
+            print(f"ES: Error deleting document: {e}")
+            return False
+
+    async def delete_documents_by_source(
+            self,
+            index_name: str,
+            source: str,
+            from_chunk_index: Optional[int] = None,
+            document_key: Optional[str] = None) -> bool:
+        try:
+            response = await self.es.delete_by_query(
+                index=index_name,
+                query=ElasticClient.source_chunks_query(source, from_chunk_index, document_key),
+                refresh=True
+            )
+            print(f"ES: {response.get('deleted', 0)} chunks of {source} deleted successfully.")
+            return True
+        except Exception as e:
+            print(f"ES: Error deleting documents of {source}: {e}")
+            return False
+
+    async def list_documents(
+            self,
+            index_name: str,
+            collapse_field: Optional[str] = None,
+            size: int = 10) -> List[Dict]:
+        body: Dict[str, Any] = {
+            "query": {"match_all": {}},
+            "_source": {"excludes": ["embeddings"]},
+            "size": size
+        }
+        if collapse_field:
+            body["collapse"] = {"field": collapse_field}
+        try:
+            return await self.search(index_name, body)
+        except Exception as e:
+            print(f"ES: Error listing documents: {e}")
+            return []
+
+    async def get_documents(
+            self,
+            index_name: str,
+            document_ids: List[str],
+            projection: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+        projection = projection or {"excludes": ["embeddings"]}
+        try:
+            response = await self.es.mget(
+                index=index_name,
+                ids=document_ids,
+                source_includes=projection.get("includes"),
+                source_excludes=projection.get("excludes"))
+            return [doc for doc in response["docs"] if doc.get("found")]
+        except Exception as e:
+            print(f"ES: Error getting documents: {e}")
+            return []
+
+    async def close(self):
+        # the client is shared by every AsyncElasticClient of the loop on the same hosts
+        loop = asyncio.get_running_loop()
+        with _async_es_clients_lock:
+            client = _async_es_clients.get(loop, {}).pop(self.hosts, None)
+        if client is not None:
+            await client.close()
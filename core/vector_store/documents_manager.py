@@ -1,27 +1,51 @@
-from core.embeddings import Embedder
-from core.types import Embeddings, Document, DocumentMetadata
+from typing import Dict, Iterator, List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import queue
+import threading
+from core.registry import get_embedder
+from core.types import DocumentBatch, DocumentMetadata
 from core.vector_store.elastic_client import ElasticClient
-from core.preprocessing import Preprocessor
+from core.preprocessing import (Preprocessor, SUPPORTED_EXTENSIONS, preprocess_file_in_worker, document_key,
+                                clean_file_name)
 import json
 import datetime
 import os
-from core.vector_store.mappings import DOCUMENT_INDEX_MAPPING
-from core.config import DOCUMENTS_INDEX_NAME
+import time
+from core.vector_store.mappings import DOCUMENT_INDEX_MAPPING, mapping_differences
+from core.config import (DOCUMENTS_INDEX_NAME, INDEX_BATCH_SIZE, INGEST_WORKERS, INGEST_QUEUE_SIZE,
+                         INGEST_ENCODE_BATCH_SIZE, MANIFEST_FILE_NAME)
 from core.vector_store.logger import ActivityLogger
+from core.manifest import IngestionManifest
+from core.semantic_cache import get_semantic_cache
+from core.config import SEMANTIC_CACHE_ENABLED
 
 
 class DocumentsManager:
     def __init__(self, raw_path: str, clean_path: str):
-        self.embedder = Embedder()
-        self.es_client = ElasticClient(hosts="http://localhost:9200")
+        self.embedder = get_embedder()
+        self.es_client = ElasticClient()
         self.preprocessor = Preprocessor(raw_path=raw_path, clean_path=clean_path)
         self.document_index_mapping = DOCUMENT_INDEX_MAPPING
         self.documents_index_name = DOCUMENTS_INDEX_NAME
+        self.manifest = IngestionManifest(os.path.join(clean_path, MANIFEST_FILE_NAME))
         self.activity_logger = ActivityLogger("documents_manager")
 
     def create_document_index(self):
         self.es_client.create_index(self.documents_index_name, mappings=self.document_index_mapping)
 
+    def document_index_differences(self) -> List[str]:
+        # an existing index keeps the mapping it was created with, see Setup.verify_setup
+        return mapping_differences(
+            self.document_index_mapping, self.es_client.get_mapping(self.documents_index_name))
+
+    def recreate_document_index(self):
+        # the mapping of an existing field cannot be changed in place, every file of the raw
+        # folder is indexed again by the next sync
+        self.es_client.delete_index(self.documents_index_name)
+        self.create_document_index()
+        self.manifest.clear()
+
     def add_document(self, index_name: str, document_path: str) -> bool:
         try:
             clean_file_path = self.preprocessor.process_file(document_path)
@@ -33,70 +57,86 @@ class DocumentsManager:
             self.activity_logger.log_interaction(f"Error preprocessing document: {e}", "error")
             return False
 
+        # chunks are streamed from the clean file by batches so memory does not depend on file size
+        nb_chunks = 0
+        start = time.perf_counter()
         try:
-            with open(clean_file_path, "r", encoding="utf-8") as file:
-                document_content = file.read()
-                document_content = json.loads(document_content)
+            for batch in self.iter_chunk_batches(clean_file_path, INDEX_BATCH_SIZE):
+                documents = self.build_documents(batch)
+                if self.es_client.bulk_index_batch(index_name, documents) != len(batch):
+                    return False
+                nb_chunks += len(batch)
         except Exception as e:
             self.activity_logger.log_interaction(
-                f"Error reading or parsing JSON file: {e}", "error")
+                f"Error indexing chunks of {document_path} to Elasticsearch: {e}", "error")
             return False
+        self.es_client.delete_documents_by_source(
+            index_name, document_path, from_chunk_index=nb_chunks, document_key=document_key(document_path))
+        self.manifest.record([document_path])
+        self.invalidate_cached_answers([document_path])
+        elapsed = time.perf_counter() - start
+        self.activity_logger.log_interaction(
+            f"Indexed document to Elasticsearch: {document_path} ({nb_chunks} chunks, "
+            f"{nb_chunks / max(elapsed, 1e-9):.1f} chunks/sec)", "info")
+        return True
 
+    def iter_chunk_batches(self, clean_file_path: str, batch_size: int) -> Iterator[List[Dict]]:
         try:
-            embedded_doc = self.embed_document(clean_file_path)
-        except Exception as e:
-            self.activity_logger.log_interaction(f"Error embedding document: {e}", "error")
-            return False
-
-        try:
-            doc_metadata = document_content.get("metadata", {})
-            date_value = doc_metadata.get("date")
-            modified_value = doc_metadata.get("modified")
-
-            date_value = date_value if date_value else None
-            modified_value = modified_value if modified_value else None
-
-            metadata = DocumentMetadata(
-                source=document_content.get("metadata", {}).get("source", ""),
-                date=date_value,
-                modified=modified_value,
-                embedding_model=embedded_doc.metadata.embedding_model,
-                embedding_date=embedded_doc.metadata.embedding_date,
-                embedding_dimension=embedded_doc.metadata.embedding_dimension
-            )
-
-            document = Document(
-                doc_title=document_content.get("doc_title", "untitled"),
-                content=str(document_content.get("content", "")),
-                embeddings=embedded_doc.embeddings,
-                metadata=metadata,
-                indexed_at=datetime.datetime.now())
-        except Exception as e:
-            self.activity_logger.log_interaction(
-                f"Error creating document metadata or document: {e}", "error")
-            return False
-
-        try:
-            res = self.es_client.index_document(index_name, document)
-            self.activity_logger.log_interaction(
-                f"Indexed document to Elasticsearch: {document.doc_title}", "info")
-            return res
+            with open(clean_file_path, "r", encoding="utf-8") as file:
+                batch = []
+                for line in file:
+                    if line.strip():
+                        batch.append(json.loads(line))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
         except Exception as e:
             self.activity_logger.log_interaction(
-                f"Error indexing document to Elasticsearch: {e}", "error")
-            return False
+                f"Error reading or parsing JSONL file: {e}", "error")
+            raise e
 
     # manage also embeddings
-    def embed_document(self, document_path: str) -> Embeddings:
+    def build_documents(self, chunks: List[Dict]) -> DocumentBatch:
         try:
-            with open(document_path, "r", encoding="utf-8") as file:
-                document_content = file.read()
-            embedded_doc = self.embedder.embed_text(document_content)
-            return embedded_doc
+            embedded_chunks = self.embedder.embed_multiple_texts(
+                [chunk["content"] for chunk in chunks])
         except Exception as e:
-            self.activity_logger.log_interaction(f"Error embedding document content: {e}", "error")
+            self.activity_logger.log_interaction(f"Error embedding chunks: {e}", "error")
             raise e
 
+        # chunks of the same file share their metadata, it is validated once per file
+        metadata_by_source: Dict[str, Dict] = {}
+        indexed_at = datetime.datetime.now()
+        documents = []
+        for chunk in chunks:
+            chunk_metadata = chunk.get("metadata", {})
+            source = chunk_metadata.get("source", "")
+            if source not in metadata_by_source:
+                metadata_by_source[source] = DocumentMetadata(
+                    source=source,
+                    date=chunk_metadata.get("date") or None,
+                    modified=chunk_metadata.get("modified") or None,
+                    embedding_model=embedded_chunks.metadata.embedding_model,
+                    embedding_date=embedded_chunks.metadata.embedding_date,
+                    embedding_dimension=embedded_chunks.metadata.embedding_dimension
+                ).model_dump()
+            documents.append({
+                "doc_title": chunk.get("doc_title", "untitled"),
+                "content": chunk["content"],
+                "metadata": metadata_by_source[source],
+                "indexed_at": indexed_at,
+                "chunk_id": chunk.get("chunk_id"),
+                "chunk_index": chunk.get("chunk_index"),
+                "start_offset": chunk.get("start_offset"),
+                "end_offset": chunk.get("end_offset")
+            })
+        return DocumentBatch(
+            ids=[chunk.get("chunk_id") for chunk in chunks],
+            documents=documents,
+            vectors=embedded_chunks.vectors)
+
     # delete also documents
     def delete_document(
             self,
@@ -109,7 +149,7 @@ class DocumentsManager:
         try:
             _, file_extension = os.path.splitext(full_path)
             raw_file_path = os.path.join(self.preprocessor.raw_path, doc_name + file_extension)
-            clean_file_path = os.path.join(self.preprocessor.clean_path, doc_name + ".json")
+            clean_file_path = os.path.join(self.preprocessor.clean_path, clean_file_name(raw_file_path))
             # delete files
             try:
                 if os.path.exists(raw_file_path):
@@ -119,20 +159,201 @@ class DocumentsManager:
             except Exception as e:
                 self.activity_logger.log_interaction(f"Error deleting files: {e}", "error")
 
+            self.invalidate_cached_answers([raw_file_path])
+            # every chunk of the file goes away, not only the selected one
+            if full_path:
+                self.manifest.forget([full_path])
+                return self.es_client.delete_documents_by_source(index_name, full_path)
             res = self.es_client.delete_document(index_name, document_id)
             return res
         except Exception as e:
             self.activity_logger.log_interaction(f"Error deleting document: {e}", "error")
             return False
 
-    def process_folder(self, index_name: str, folder_path: str):
+    def invalidate_cached_answers(self, file_paths: List[str]):
+        # the semantic cache keys the answers on the document key of the chunks they cite
+        if SEMANTIC_CACHE_ENABLED:
+            get_semantic_cache().invalidate_documents(document_key(path) for path in file_paths)
+
+    def list_raw_files(self, folder_path: str) -> List[str]:
+        return [os.path.join(folder_path, x) for x in sorted(os.listdir(folder_path))
+                if x.endswith(SUPPORTED_EXTENSIONS) and os.path.isfile(os.path.join(folder_path, x))]
+
+    def process_folder(
+            self,
+            index_name: str,
+            folder_path: str,
+            workers: int = INGEST_WORKERS) -> Dict[str, Dict[str, float]]:
         try:
-            import os
-            for filename in os.listdir(folder_path):
-                file_path = os.path.join(folder_path, filename)
-                if os.path.isfile(file_path):
-                    self.add_document(index_name, file_path)
+            file_paths = self.list_raw_files(folder_path)
         except Exception as e:
             self.activity_logger.log_interaction(
                 f"Error processing folder {folder_path}: {e}", "error")
             raise e
+        return self.process_files(index_name, file_paths, workers=workers)
+
+    def sync_folder(self, index_name: str, folder_path: str) -> Dict[str, int]:
+        # only the files whose content changed since the last ingestion are reprocessed,
+        # the chunks of the removed files are deleted
+        changed, removed = self.manifest.diff(self.list_raw_files(folder_path))
+        deleted = []
+        for file_path in removed:
+            # a file whose chunks could not be deleted stays in the manifest, the next sync retries
+            if not self.es_client.delete_documents_by_source(index_name, file_path):
+                self.activity_logger.log_interaction(
+                    f"Could not delete the chunks of removed file {file_path}, kept for the next sync", "warning")
+                continue
+            clean_file_path = os.path.join(self.preprocessor.clean_path, clean_file_name(file_path))
+            if os.path.exists(clean_file_path):
+                os.remove(clean_file_path)
+            deleted.append(file_path)
+        if deleted:
+            self.manifest.forget(deleted)
+            self.invalidate_cached_answers(deleted)
+        if changed:
+            self.process_files(index_name, changed)
+        self.activity_logger.log_interaction(
+            f"Synced {folder_path}: {len(changed)} changed, {len(deleted)} removed", "info")
+        return {"changed": len(changed), "removed": len(deleted)}
+
+    def process_files(
+            self,
+            index_name: str,
+            file_paths: List[str],
+            workers: int = INGEST_WORKERS) -> Dict[str, Dict[str, float]]:
+        # three stages linked by bounded queues:
+        # parse (process pool) -> encode (this thread, big batches) -> write (parallel_bulk thread)
+        folder_path = os.path.commonpath(file_paths) if file_paths else ""
+        parsed_files: List[str] = []
+        nb_chunks_sent = 0
+        chunk_queue: queue.Queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        document_queue: queue.Queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        stop = threading.Event()
+        errors: List[Exception] = []
+        stats = {stage: {"items": 0, "seconds": 0.0} for stage in ("parse", "encode", "write")}
+
+        def put(q: queue.Queue, item) -> bool:
+            # never block forever if another stage failed
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def parse_stage():
+            nonlocal nb_chunks_sent
+            start = time.perf_counter()
+            pending: List[Dict] = []
+            try:
+                with ProcessPoolExecutor(
+                        max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    futures = {pool.submit(preprocess_file_in_worker, self.preprocessor.raw_path,
+                                           self.preprocessor.clean_path, path): path
+                               for path in file_paths}
+                    for future in as_completed(futures):
+                        if stop.is_set():
+                            break
+                        try:
+                            clean_file_path = future.result()
+                        except Exception as e:
+                            self.activity_logger.log_interaction(
+                                f"Error preprocessing {futures[future]}: {e}", "error")
+                            continue
+                        if not clean_file_path:
+                            continue
+                        stats["parse"]["items"] += 1
+                        parsed_files.append(futures[future])
+                        nb_chunks = 0
+                        for batch in self.iter_chunk_batches(clean_file_path, INGEST_ENCODE_BATCH_SIZE):
+                            nb_chunks += len(batch)
+                            nb_chunks_sent += len(batch)
+                            pending.extend(batch)
+                            # batches are filled across files so that small files share an encode call
+                            while len(pending) >= INGEST_ENCODE_BATCH_SIZE:
+                                if not put(chunk_queue, pending[:INGEST_ENCODE_BATCH_SIZE]):
+                                    return
+                                pending = pending[INGEST_ENCODE_BATCH_SIZE:]
+                        self.es_client.delete_documents_by_source(
+                            index_name, futures[future], from_chunk_index=nb_chunks,
+                            document_key=document_key(futures[future]))
+                if pending:
+                    put(chunk_queue, pending)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                stats["parse"]["seconds"] = time.perf_counter() - start
+                put(chunk_queue, None)
+
+        def write_stage():
+            try:
+                while True:
+                    documents = document_queue.get()
+                    if documents is None:
+                        break
+                    start = time.perf_counter()
+                    stats["write"]["items"] += self.es_client.parallel_bulk_index_batch(
+                        index_name, documents)
+                    stats["write"]["seconds"] += time.perf_counter() - start
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+        parser = threading.Thread(target=parse_stage, name="ingest-parse", daemon=True)
+        writer = threading.Thread(target=write_stage, name="ingest-write", daemon=True)
+        parser.start()
+        writer.start()
+        try:
+            while True:
+                try:
+                    chunks = chunk_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if stop.is_set():
+                        break
+                    continue
+                if chunks is None:
+                    break
+                start = time.perf_counter()
+                documents = self.build_documents(chunks)
+                stats["encode"]["items"] += len(documents.documents)
+                stats["encode"]["seconds"] += time.perf_counter() - start
+                if not put(document_queue, documents):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            while writer.is_alive():
+                try:
+                    document_queue.put(None, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            writer.join()
+            parser.join()
+
+        for stage, stage_stats in stats.items():
+            stage_stats["per_second"] = stage_stats["items"] / max(stage_stats["seconds"], 1e-9)
+        self.activity_logger.log_interaction(
+            "Folder ingestion of {}: parse {:.0f} files in {:.1f}s ({:.2f} files/sec), "
+            "encode {:.0f} chunks in {:.1f}s ({:.1f} chunks/sec), "
+            "write {:.0f} chunks in {:.1f}s ({:.1f} chunks/sec)".format(
+                folder_path,
+                *(stats[stage][key] for stage in ("parse", "encode", "write")
+                  for key in ("items", "seconds", "per_second"))), "info")
+        # even a partial ingestion changed the chunks of these files
+        self.invalidate_cached_answers(parsed_files)
+        if errors:
+            self.activity_logger.log_interaction(
+                f"Error processing folder {folder_path}: {errors[0]}", "error")
+            raise errors[0]
+        # files are only marked as ingested when every one of their chunks reached the index
+        if stats["write"]["items"] == nb_chunks_sent:
+            self.manifest.record(parsed_files)
+        else:
+            self.activity_logger.log_interaction(
+                f"{nb_chunks_sent - stats['write']['items']:.0f} chunks were not indexed, "
+                "the files will be processed again at next startup", "warning")
+        return stats
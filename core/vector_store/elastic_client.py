@@ -1,13 +1,43 @@
 from elasticsearch import Elasticsearch
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional
+import base64
+import threading
+import numpy as np
 from elasticsearch import helpers
-from pydantic import ValidationError
-from core.types import Document
+from core.types import Document, DocumentBatch
+from core.config import (ES_BULK_THREADS, ES_BULK_CHUNK_SIZE, ES_VECTOR_ENCODING,
+                         KNN_NUM_CANDIDATES_FACTOR, HYBRID_FUSION, HYBRID_BM25_WEIGHT,
+                         HYBRID_KNN_WEIGHT, RRF_RANK_CONSTANT, RRF_RANK_WINDOW_SIZE, ES_HOSTS,
+                         ES_CONNECTIONS_PER_NODE, ES_REQUEST_TIMEOUT, ES_MAX_RETRIES,
+                         ES_RETRY_ON_TIMEOUT)
+
+# fields returned by the searches of the pipeline
+DEFAULT_SEARCH_PROJECTION = {"includes": ["doc_title", "content"]}
+
+
+_es_clients: Dict[str, Elasticsearch] = {}
+_es_clients_lock = threading.Lock()
+
+
+def get_es_client(hosts: str = ES_HOSTS) -> Elasticsearch:
+    # the Elasticsearch client is thread safe, every component of the process shares the
+    # same instance and its connection pool instead of opening its own
+    with _es_clients_lock:
+        if hosts not in _es_clients:
+            _es_clients[hosts] = Elasticsearch(
+                hosts=hosts,
+                verify_certs=False,
+                connections_per_node=ES_CONNECTIONS_PER_NODE,
+                request_timeout=ES_REQUEST_TIMEOUT,
+                max_retries=ES_MAX_RETRIES,
+                retry_on_timeout=ES_RETRY_ON_TIMEOUT
+            )
+        return _es_clients[hosts]
 
 
 class ElasticClient:
-    def __init__(self, hosts: str):
-        self.es = Elasticsearch(hosts=hosts, verify_certs=False)
+    def __init__(self, hosts: str = ES_HOSTS):
+        self.es = get_es_client(hosts)
 
     def verify_index(self, index_name: str) -> bool:
         # this will be usefull when lauching the app to verify that the index
@@ -19,37 +49,77 @@ class ElasticClient:
             return False
 
     def index_document(self, index_name: str, document: Document) -> bool:
-        # first we validate the document using Pydantic
-        try:
-            # this will raise an error if the types are not correct
-            Document(**document.model_dump())
-        except ValidationError as e:
-            print(f"ES: Invalid document types: {e}")
-            return False
-
+        # the document has already been validated by pydantic when it was built
         self.es.index(index=index_name, document=document.model_dump())
         print(f"ES: Document indexed successfully, name: {document.doc_title}")
         return True
 
     def bulk_index_documents(self, index_name: str, documents: List[Document]) -> bool:
-        try:
-            for document in documents:
-                # this will raise an error if the types are not correct
-                Document(**document.model_dump())
-        except ValidationError as e:
-            print(f"ES: Invalid document types in bulk: {e}")
-            return False
+        # for large batches prefer bulk_index_batch which skips the per-float python objects
+        helpers.bulk(self.es, self._document_actions(index_name, documents))
+        print(f"ES: Bulk indexed {len(documents)} documents successfully.")
+        return True
+
+    def bulk_index_batch(self, index_name: str, batch: DocumentBatch) -> int:
+        nb_indexed, errors = helpers.bulk(
+            self.es, self.batch_actions(index_name, batch), raise_on_error=False)
+        if errors:
+            print(f"ES: Errors in bulk: {errors[:3]}")
+        print(f"ES: Bulk indexed {nb_indexed}/{len(batch.documents)} documents.")
+        return nb_indexed
 
-        actions = [
+    def parallel_bulk_index_batch(
+            self,
+            index_name: str,
+            batch: DocumentBatch,
+            thread_count: int = ES_BULK_THREADS,
+            chunk_size: int = ES_BULK_CHUNK_SIZE) -> int:
+        nb_failed = 0
+        for ok, item in helpers.parallel_bulk(
+                self.es,
+                self.batch_actions(index_name, batch),
+                thread_count=thread_count,
+                chunk_size=chunk_size,
+                raise_on_error=False):
+            if not ok:
+                nb_failed += 1
+                print(f"ES: Error in parallel bulk: {item}")
+        print(f"ES: Parallel bulk indexed {len(batch.documents) - nb_failed}/{len(batch.documents)} documents.")
+        return len(batch.documents) - nb_failed
+
+    @staticmethod
+    def batch_actions(index_name: str, batch: DocumentBatch) -> Iterator[Dict]:
+        # chunks carry their own id so that reindexing a document overwrites its chunks
+        for document_id, document, vector in zip(batch.ids, batch.documents,
+                                                   ElasticClient.encode_vectors(batch.vectors)):
+            yield {
+                "_index": index_name,
+                "_source": {**document, "embeddings": vector},
+                **({"_id": document_id} if document_id else {})
+            }
+
+    @staticmethod
+    def encode_vectors(vectors: np.ndarray) -> Iterator[Any]:
+        if ES_VECTOR_ENCODING == "base64":
+            # elasticsearch accepts a float dense_vector as the base64 of its big-endian float32
+            # bytes: one short string per vector instead of 768 python floats
+            big_endian = np.ascontiguousarray(vectors, dtype=">f4")
+            for row in big_endian:
+                yield base64.b64encode(memoryview(row)).decode("ascii")
+        else:
+            for row in vectors:
+                yield row.tolist()
+
+    def _document_actions(self, index_name: str, documents: List[Document]) -> List[Dict]:
+        # chunks carry their own id so that reindexing a document overwrites its chunks
+        return [
             {
                 "_index": index_name,
-                "_source": document.model_dump()
+                "_source": document.model_dump(),
+                **({"_id": document.chunk_id} if document.chunk_id else {})
             }
             for document in documents
         ]
-        helpers.bulk(self.es, actions)
-        print(f"ES: Bulk indexed {len(documents)} documents successfully.")
-        return True
 
     def delete_document(self, index_name: str, document_id: str) -> bool:
         try:
@@ -60,15 +130,60 @@ class ElasticClient:
             print(f"ES: Error deleting document: {e}")
             return False
 
-    def list_documents(self, index_name: str) -> List[Dict]:
+    @staticmethod
+    def source_chunks_query(
+            source: str,
+            from_chunk_index: Optional[int] = None,
+            document_key: Optional[str] = None) -> Dict[str, Any]:
+        # a raw file is indexed as several chunks sharing the same metadata.source,
+        # from_chunk_index only selects the chunks left over by a previous longer version, and
+        # document_key also the chunks whose id was made with another key (older chunk ids)
+        query: Dict[str, Any] = {"filter": [{"term": {"metadata.source": source}}]}
+        if from_chunk_index is not None:
+            leftovers: List[Dict[str, Any]] = [{"range": {"chunk_index": {"gte": from_chunk_index}}}]
+            if document_key is not None:
+                leftovers.append({"bool": {"must_not": {"prefix": {"chunk_id": f"{document_key}-"}}}})
+            query["should"] = leftovers
+            query["minimum_should_match"] = 1
+        return {"bool": query}
+
+    def delete_documents_by_source(
+            self,
+            index_name: str,
+            source: str,
+            from_chunk_index: Optional[int] = None,
+            document_key: Optional[str] = None) -> bool:
         try:
+            response = self.es.delete_by_query(
+                index=index_name,
+                query=self.source_chunks_query(source, from_chunk_index, document_key),
+                refresh=True
+            )
+            print(f"ES: {response.get('deleted', 0)} chunks of {source} deleted successfully.")
+            return True
+        except Exception as e:
+            print(f"ES: Error deleting documents of {source}: {e}")
+            return False
+
+    def list_documents(
+            self,
+            index_name: str,
+            collapse_field: Optional[str] = None,
+            size: int = 10) -> List[Dict]:
+        try:
+            body: Dict[str, Any] = {
+                "query": {
+                    "match_all": {}
+                },
+                "_source": {"excludes": ["embeddings"]},
+                "size": size
+            }
+            if collapse_field:
+                # one hit per value of the field, e.g. one chunk per source file
+                body["collapse"] = {"field": collapse_field}
             response = self.es.search(
                 index=index_name,
-                body={
-                    "query": {
-                        "match_all": {}
-                    },
-                }
+                body=body
             )
             documents = response["hits"]["hits"]
             return documents
@@ -78,23 +193,190 @@ class ElasticClient:
 
     def cosine_similarity_search(
             self, index_name: str, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        query = {
-            "script_score": {
-                "query": {"match_all": {}},
-                "script": {
-                    "source": "cosineSimilarity(params.query_vector, 'embeddings') + 1.0",
-                    "params": {"query_vector": query_embedding}
-                }
+        return self.retrieve(index_name, "exact", "", query_embedding, top_k)
+
+    def knn_search(
+            self,
+            index_name: str,
+            query_embedding: List[float],
+            top_k: int = 5,
+            num_candidates: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.retrieve(index_name, "knn", "", query_embedding, top_k,
+                             {"num_candidates": num_candidates})
+
+    def hybrid_search(
+            self,
+            index_name: str,
+            query_text: str,
+            query_embedding: List[float],
+            top_k: int = 5,
+            options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.retrieve(index_name, "hybrid", query_text, query_embedding, top_k, options)
+
+    def retrieve(
+            self,
+            index_name: str,
+            mode: str,
+            query_text: str,
+            query_embedding: List[float],
+            top_k: int = 5,
+            options: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+        bodies = self.build_search_bodies(
+            mode, query_text, query_embedding, top_k, options, projection)
+        try :
+            if len(bodies) == 1:
+                results = [self.es.search(index=index_name, body=bodies[0])["hits"]["hits"]]
+            else:
+                results = self.msearch(index_name, bodies)
+            return self.merge_search_results(mode, results, top_k, options)
+        except Exception as e:
+            print(f"ES: Error during {mode} search: {e}")
+            return []
+
+    def msearch(self, index_name: str, bodies: List[Dict]) -> List[List[Dict[str, Any]]]:
+        # several searches in a single round trip, a failed search gives an empty list
+        searches: List[Dict] = []
+        for body in bodies:
+            searches.extend([{"index": index_name}, body])
+        response = self.es.msearch(searches=searches)
+        results = []
+        for item in response["responses"]:
+            if "error" in item:
+                print(f"ES: Error in msearch: {item['error']}")
+                results.append([])
+            else:
+                results.append(item["hits"]["hits"])
+        return results
+
+    def build_search_bodies(
+            self,
+            mode: str,
+            query_text: str,
+            query_embedding: List[float],
+            top_k: int,
+            options: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+        # projection is the _source filter ({"includes": [...], "excludes": [...]}), by default
+        # only the fields needed by the pipeline come back, never the embeddings
+        bodies = self._build_search_bodies(mode, query_text, query_embedding, top_k, options)
+        for body in bodies:
+            body["_source"] = projection or DEFAULT_SEARCH_PROJECTION
+        return bodies
+
+    def _build_search_bodies(
+            self,
+            mode: str,
+            query_text: str,
+            query_embedding: List[float],
+            top_k: int,
+            options: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        # mode "exact": script_score on every chunk, kept as a fallback and as the reference
+        #      "knn": approximate search on the HNSW graph
+        #      "hybrid": BM25 on content/doc_title fused with knn, see merge_search_results
+        options = options or {}
+        num_candidates = options.get("num_candidates")
+        if mode == "exact":
+            return [{
+                "query": {
+                    "script_score": {
+                        "query": {"match_all": {}},
+                        "script": {
+                            "source": "cosineSimilarity(params.query_vector, 'embeddings') + 1.0",
+                            "params": {"query_vector": query_embedding}
+                        }
+                    }
+                },
+                "size": top_k
+            }]
+        if mode == "knn":
+            return [{"knn": self._knn_clause(query_embedding, top_k, num_candidates), "size": top_k}]
+        if mode == "hybrid":
+            fusion = options.get("fusion", HYBRID_FUSION)
+            if fusion == "weighted":
+                # one search, the score is bm25_weight * bm25 + knn_weight * similarity
+                return [{
+                    "query": self._bm25_clause(query_text, options.get("bm25_weight", HYBRID_BM25_WEIGHT)),
+                    "knn": {**self._knn_clause(query_embedding, top_k, num_candidates),
+                            "boost": options.get("knn_weight", HYBRID_KNN_WEIGHT)},
+                    "size": top_k
+                }]
+            if fusion == "rrf":
+                # both rankings are fetched in one msearch and fused here, this does not need
+                # the rrf retriever (not available with every license)
+                window = max(options.get("rank_window_size", RRF_RANK_WINDOW_SIZE), top_k)
+                return [
+                    {"query": self._bm25_clause(query_text), "size": window},
+                    {"knn": self._knn_clause(query_embedding, window, num_candidates), "size": window}
+                ]
+            raise ValueError(f"Unknown fusion: {fusion}")
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    def merge_search_results(
+            self,
+            mode: str,
+            results: List[List[Dict[str, Any]]],
+            top_k: int,
+            options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        options = options or {}
+        if mode == "hybrid" and options.get("fusion", HYBRID_FUSION) == "rrf":
+            rank_constant = options.get("rank_constant", RRF_RANK_CONSTANT)
+            fused: Dict[str, Dict[str, Any]] = {}
+            for hits in results:
+                for rank, hit in enumerate(hits, start=1):
+                    entry = fused.setdefault(hit["_id"], {**hit, "_score": 0.0})
+                    entry["_score"] += 1.0 / (rank_constant + rank)
+            return sorted(fused.values(), key=lambda hit: hit["_score"], reverse=True)[:top_k]
+        return results[0][:top_k]
+
+    def _knn_clause(self, query_embedding: List[float], k: int, num_candidates: Optional[int]) -> Dict:
+        return {
+            "field": "embeddings",
+            "query_vector": query_embedding,
+            "k": k,
+            "num_candidates": max(num_candidates or k * KNN_NUM_CANDIDATES_FACTOR, k)
+        }
+
+    def _bm25_clause(self, query_text: str, boost: float = 1.0) -> Dict:
+        # content and doc_title are analysed with the french analyzer (see mappings.py)
+        return {
+            "multi_match": {
+                "query": query_text,
+                "fields": ["content", "doc_title^2"],
+                "boost": boost
             }
         }
-        try :
-            response = self.es.search(index=index_name, query=query)
-            if not response["hits"]["hits"]:
-                return [{}]
-            return response["hits"]["hits"]
+
+    def get_documents(
+            self,
+            index_name: str,
+            document_ids: List[str],
+            projection: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+        # fetch full documents by id, used when a light hit is not enough
+        projection = projection or {"excludes": ["embeddings"]}
+        try:
+            response = self.es.mget(
+                index=index_name,
+                ids=document_ids,
+                source_includes=projection.get("includes"),
+                source_excludes=projection.get("excludes"))
+            return [doc for doc in response["docs"] if doc.get("found")]
+        except Exception as e:
+            print(f"ES: Error getting documents: {e}")
+            return []
+
+    def get_mapping(self, index_name: str) -> Dict:
+        response = self.es.indices.get_mapping(index=index_name)
+        # keyed by the concrete index name, which differs from index_name for an alias
+        return next(iter(response.body.values()))["mappings"]
+
+    def delete_index(self, index_name: str):
+        try:
+            self.es.indices.delete(index=index_name, ignore_unavailable=True)
+            print(f"ES: Index {index_name} deleted successfully.")
         except Exception as e:
-            print(f"ES: Error during cosine similarity search: {e}")
-            return [{}]
+            print(f"ES: Error deleting index {index_name}: {e}")
+            raise e
 
     def create_index(self, index_name: str, mappings: Dict):
         try :
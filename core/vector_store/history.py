@@ -1,75 +1,145 @@
 from typing import List, Dict
 from core.vector_store.elastic_client import ElasticClient
+from core.vector_store.async_elastic_client import AsyncElasticClient
 import datetime
 from core.vector_store.mappings import HISTORY_INDEX_MAPPING, MESSAGE_INDEX_MAPPING
-from core.pipeline.title import TitleAgent
 from core.config import HISTORY_INDEX_NAME, MESSAGE_INDEX_NAME
 from core.vector_store.logger import ActivityLogger
 
+SUMMARY_ROLE = "summary"
+
 
 class History:
     def __init__(self):
         self.history_index_name = HISTORY_INDEX_NAME  # -> index for conversations
         self.message_index_name = MESSAGE_INDEX_NAME  # -> index for messages
-        self.es_client = ElasticClient(hosts="http://localhost:9200")
+        self.es_client = ElasticClient()
+        self.async_es_client = AsyncElasticClient()
         self.history_index_mapping = HISTORY_INDEX_MAPPING
         self.message_index_mapping = MESSAGE_INDEX_MAPPING
-        self.title_agent = TitleAgent()
+        self._title_agent = None  # langchain is only imported for the first conversation title
         self.activity_logger = ActivityLogger("history_manager")
 
+    @property
+    def title_agent(self):
+        if self._title_agent is None:
+            from core.pipeline.title import TitleAgent
+            self._title_agent = TitleAgent()
+        return self._title_agent
+
     def list_history(self):
         try:
             response = self.es_client.es.search(
-                index=self.history_index_name,
-                body={
-                    "query": {
-                        "match_all": {}
-                    },
-                    "sort": [
-                        {"created_at": {"order": "desc"}}
-                    ]
-                }
-            )
-            histories = []
-            for hit in response['hits']['hits']:
-                source = hit['_source']
-                histories.append({
-                    "id": source.get("id", ""),
-                    "created_at": source.get("created_at", ""),
-                    "title": source.get("title", "")
-                })
-            return histories
+                index=self.history_index_name, body=self._history_query())
+            return self._to_histories(response['hits']['hits'])
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error listing history: {e}", "error")
+            return []
+
+    async def list_history_async(self):
+        try:
+            hits = await self.async_es_client.search(self.history_index_name, self._history_query())
+            return self._to_histories(hits)
         except Exception as e:
             self.activity_logger.log_interaction(f"Error listing history: {e}", "error")
             return []
 
+    @staticmethod
+    def _history_query() -> Dict:
+        return {
+            "query": {
+                "match_all": {}
+            },
+            "sort": [
+                {"created_at": {"order": "desc"}}
+            ]
+        }
+
+    @staticmethod
+    def _to_histories(hits: List[Dict]) -> List[dict]:
+        histories = []
+        for hit in hits:
+            source = hit['_source']
+            histories.append({
+                "id": source.get("id", ""),
+                "created_at": source.get("created_at", ""),
+                "title": source.get("title", "")
+            })
+        return histories
+
     def load_messages(self, conversation_id: str) -> List[dict]:
         try:
             response = self.es_client.es.search(
-                index=self.message_index_name,
-                body={
-                    "query": {
-                        "match": {
-                            "conversation_id": conversation_id
-                        }
-                    },
-                    "sort": [
-                        {"timestamp": {"order": "asc"}}
-                    ]
-                }
-            )
-            messages = []
-            for hit in response['hits']['hits']:
-                source = hit['_source']
-                messages.append({
-                    "role": source.get("role", "user"),
-                    "content": source.get("message", "")
-                })
-            return messages
+                index=self.message_index_name, body=self._messages_query(conversation_id))
+            return self._to_messages(response['hits']['hits'])
         except Exception as e:
             self.activity_logger.log_interaction(f"Error loading messages: {e}", "error")
             return []
 
+    async def load_messages_async(self, conversation_id: str) -> List[dict]:
+        try:
+            hits = await self.async_es_client.search(
+                self.message_index_name, self._messages_query(conversation_id))
+            return self._to_messages(hits)
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error loading messages: {e}", "error")
+            return []
+
+    @staticmethod
+    def _messages_query(conversation_id: str, role: str | None = None, order: str = "asc") -> Dict:
+        # the rolling summaries of the QA agent memory are stored as messages with the "summary" role,
+        # they are never displayed
+        filters: List[Dict] = [{"term": {"conversation_id.keyword": conversation_id}}]
+        if role:
+            filters.append({"term": {"role": role}})
+        return {
+            "query": {
+                "bool": {
+                    "filter": filters,
+                    "must_not": [] if role else [{"term": {"role": SUMMARY_ROLE}}]
+                }
+            },
+            "sort": [
+                {"timestamp": {"order": order}}
+            ]
+        }
+
+    def load_recent_messages(self, conversation_id: str, size: int) -> List[dict]:
+        # the last messages only, in chronological order
+        try:
+            body = self._messages_query(conversation_id, order="desc")
+            body["size"] = size
+            hits = self.es_client.es.search(index=self.message_index_name, body=body)['hits']['hits']
+            return self._to_messages(list(reversed(hits)))
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error loading recent messages: {e}", "error")
+            return []
+
+    def load_summary(self, conversation_id: str) -> str:
+        try:
+            body = self._messages_query(conversation_id, role=SUMMARY_ROLE, order="desc")
+            body["size"] = 1
+            hits = self.es_client.es.search(index=self.message_index_name, body=body)['hits']['hits']
+            return hits[0]['_source'].get("message", "") if hits else ""
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error loading conversation summary: {e}", "error")
+            return ""
+
+    def save_summary(self, conversation_id: str, summary: str) -> bool:
+        return self.add_message_to_history(
+            self.message_index_name, message=self._message_doc(summary, conversation_id, SUMMARY_ROLE))
+
+    @staticmethod
+    def _to_messages(hits: List[Dict]) -> List[dict]:
+        messages = []
+        for hit in hits:
+            source = hit['_source']
+            messages.append({
+                "role": source.get("role", "user"),
+                "content": source.get("message", "")
+            })
+        return messages
+
     def create_conversation(self, conversation_id: str, message: str) -> bool:
         try:
             try :
@@ -93,20 +163,35 @@ class History:
 
     def add_message(self, message: str, conversation_id: str, role: str) -> bool:
         try:
-            message_doc = {
-                "id": "2345",
-                "conversation_id": conversation_id,
-                "message": message,
-                "role": role,
-                "timestamp": datetime.datetime.utcnow().replace(
-                    microsecond=0).isoformat().replace(
-                    'T',
-                    ' ')}
+            message_doc = self._message_doc(message, conversation_id, role)
             return self.add_message_to_history(self.message_index_name, message=message_doc)
         except Exception as e:
             self.activity_logger.log_interaction(f"Error adding message: {e}", "error")
             return False
 
+    async def add_message_async(self, message: str, conversation_id: str, role: str) -> bool:
+        # same as add_message but does not block the event loop, e.g. while the pipeline runs
+        try:
+            message_doc = self._message_doc(message, conversation_id, role)
+            await self.async_es_client.index_document(self.message_index_name, message_doc)
+            print("HISTORY: Message added successfully")
+            return True
+        except Exception as e:
+            self.activity_logger.log_interaction(f"Error adding message: {e}", "error")
+            return False
+
+    @staticmethod
+    def _message_doc(message: str, conversation_id: str, role: str) -> Dict:
+        return {
+            "id": "2345",
+            "conversation_id": conversation_id,
+            "message": message,
+            "role": role,
+            "timestamp": datetime.datetime.utcnow().replace(
+                microsecond=0).isoformat().replace(
+                'T',
+                ' ')}
+
     def create_history_index(self):
         self.es_client.create_index(self.history_index_name, mappings=self.history_index_mapping)
 
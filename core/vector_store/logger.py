@@ -1,14 +1,112 @@
 from core.vector_store.elastic_client import ElasticClient
 from core.vector_store.mappings import LOGGER_INDEX_MAPPING
-from core.config import LOGGER_INDEX_NAME
+from core.config import (LOGGER_INDEX_NAME, LOGGER_QUEUE_SIZE, LOGGER_FLUSH_SIZE,
+                         LOGGER_FLUSH_INTERVAL, LOGGER_HIGH_WATERMARK, LOGGER_SAMPLE_RATE)
+from elasticsearch import helpers
+from typing import Dict, List, Optional
+import atexit
 import datetime
+import itertools
+import queue
+import threading
+import time
+
+# levels that are sampled first when the queue fills up, warnings and errors are only dropped
+# when the queue is full
+SAMPLED_LEVELS = {"info", "debug"}
+
+
+class LogShipper:
+    # background thread draining a bounded queue of log lines into the logger index with bulk requests
+    def __init__(
+            self,
+            es_client: ElasticClient,
+            index_name: str = LOGGER_INDEX_NAME,
+            max_queue_size: int = LOGGER_QUEUE_SIZE,
+            flush_size: int = LOGGER_FLUSH_SIZE,
+            flush_interval: float = LOGGER_FLUSH_INTERVAL):
+        self.es_client = es_client
+        self.index_name = index_name
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.high_watermark = int(max_queue_size * LOGGER_HIGH_WATERMARK)
+        self.sample_counter = itertools.count()
+        self.dropped = 0
+        self.sampled_out = 0
+        self.sent = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="activity-logger", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, record: Dict) -> bool:
+        # never blocks: under backpressure low priority lines are sampled, then everything is dropped
+        if record["level"] in SAMPLED_LEVELS and self.queue.qsize() >= self.high_watermark:
+            if next(self.sample_counter) % LOGGER_SAMPLE_RATE:
+                self.sampled_out += 1
+                return False
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        batch: List[Dict] = []
+        deadline = time.monotonic() + self.flush_interval
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            try:
+                batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0.01)))
+            except queue.Empty:
+                pass
+            if len(batch) >= self.flush_size or (batch and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch: List[Dict]):
+        try:
+            nb_sent, _ = helpers.bulk(
+                self.es_client.es,
+                ({"_index": self.index_name, "_source": record} for record in batch),
+                raise_on_error=False)
+            self.sent += nb_sent
+        except Exception as e:
+            self.dropped += len(batch)
+            print(f"Error logging {len(batch)} interactions to {self.index_name}: {e}")
+
+    def close(self, timeout: float = 5.0):
+        # flush what is left in the queue, called at interpreter exit
+        self.stop_event.set()
+        self.thread.join(timeout=timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self.queue.qsize(), "sent": self.sent,
+                "sampled_out": self.sampled_out, "dropped": self.dropped}
+
+
+_log_shipper: Optional[LogShipper] = None
+_log_shipper_lock = threading.Lock()
+
+
+def get_log_shipper() -> LogShipper:
+    global _log_shipper
+    with _log_shipper_lock:
+        if _log_shipper is None:
+            _log_shipper = LogShipper(ElasticClient())
+        return _log_shipper
 
 
 class ActivityLogger:
     def __init__(self, source: str = "system"):
         self.source = source
         self.logger_index_name = LOGGER_INDEX_NAME
-        self.es_client = ElasticClient(hosts="http://localhost:9200")
+        self.es_client = ElasticClient()
         self.mapping = LOGGER_INDEX_MAPPING
 
     def create_index(self) -> bool:
@@ -27,20 +125,18 @@ class ActivityLogger:
             return False
 
     def log_interaction(self, interaction: str, level: str) -> bool:
+        # the line is only queued, it is sent to elasticsearch by the LogShipper thread
         try:
             # log action to terminal
             print(f"{self.source.upper()}: {interaction}")
-            self.es_client.es.index(
-                index=self.logger_index_name,
-                body={
-                    "interaction": interaction,
-                    "level": level,
-                    "source": self.source,
-                    "timestamp": datetime.datetime.utcnow().replace(
-                        microsecond=0).isoformat().replace(
-                        'T',
-                        ' ')})
-            return True
+            return get_log_shipper().submit({
+                "interaction": interaction,
+                "level": level,
+                "source": self.source,
+                "timestamp": datetime.datetime.utcnow().replace(
+                    microsecond=0).isoformat().replace(
+                    'T',
+                    ' ')})
         except Exception as e:
             print(f"Error logging interaction to {self.logger_index_name}: {e}")
             return False
@@ -1,3 +1,6 @@
+from typing import Dict, List
+from core.config import HNSW_INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION
+
 embeddings_dimension = 768
 
 HISTORY_INDEX_MAPPING = {
@@ -33,9 +36,19 @@ MESSAGE_INDEX_MAPPING = {
 
 DOCUMENT_INDEX_MAPPING = {
     "properties": {
-        "doc_title": {"type": "text"},
-        "content": {"type": "text"},
-        "embeddings": {"type": "dense_vector", "dims": embeddings_dimension},
+        "doc_title": {"type": "text", "analyzer": "french"},
+        "content": {"type": "text", "analyzer": "french"},
+        "embeddings": {
+            "type": "dense_vector",
+            "dims": embeddings_dimension,
+            "index": True,
+            "similarity": "cosine",
+            "index_options": {
+                "type": HNSW_INDEX_TYPE,
+                "m": HNSW_M,
+                "ef_construction": HNSW_EF_CONSTRUCTION
+            }
+        },
         "metadata": {
             "properties": {
                 "source": {"type": "keyword"},
@@ -46,7 +59,11 @@ DOCUMENT_INDEX_MAPPING = {
                 "embedding_dimension": {"type": "integer"}
             }
         },
-        "indexed_at": {"type": "date"}
+        "indexed_at": {"type": "date"},
+        "chunk_id": {"type": "keyword"},
+        "chunk_index": {"type": "integer"},
+        "start_offset": {"type": "integer"},
+        "end_offset": {"type": "integer"}
     }}
 
 LOGGER_INDEX_MAPPING = {
@@ -64,3 +81,16 @@ LOGGER_INDEX_MAPPING = {
         }
     }
 }
+
+
+def mapping_differences(expected: Dict, actual: Dict, path: str = "") -> List[str]:
+    # fields of the expected mapping missing or set differently in the live mapping of an index;
+    # elasticsearch adds its defaults to the live mapping so only the expected keys are compared
+    differences = []
+    for key, value in expected.items():
+        field_path = path if key == "properties" else (f"{path}.{key}" if path else key)
+        if isinstance(value, dict) and isinstance(actual.get(key), dict):
+            differences.extend(mapping_differences(value, actual[key], field_path))
+        elif actual.get(key) != value:
+            differences.append(field_path)
+    return differences
@@ -1,16 +1,17 @@
 # simple class just to avoid using es class directly in the pipeline
 
+from typing import Any, Dict, List, Optional
 from core.vector_store.elastic_client import ElasticClient
-from core.embeddings import Embedder
+from core.registry import get_embedder
 from core.types import ElasticsearchAnswer, ElasticsearchAnswerItem
-from core.config import DOCUMENTS_INDEX_NAME
+from core.config import DOCUMENTS_INDEX_NAME, RETRIEVAL_MODE
 from core.vector_store.logger import ActivityLogger
 
 
 class Retriever:
     def __init__(self):
-        self.es_client = ElasticClient(hosts="http://localhost:9200")
-        self.embedder = Embedder()
+        self.es_client = ElasticClient()
+        self.embedder = get_embedder()
         self.documents_index_name = DOCUMENTS_INDEX_NAME
         self.logger = ActivityLogger("retriever")
 
@@ -18,25 +19,89 @@ class Retriever:
             self,
             query: str,
             top_k: int = 5,
-            source: str = "N/A") -> ElasticsearchAnswer:
+            source: str = "N/A",
+            mode: str = RETRIEVAL_MODE,
+            options: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, List[str]]] = None) -> ElasticsearchAnswer:
+        # mode "knn" uses the HNSW index, "exact" scores every chunk with script_score and
+        # "hybrid" fuses BM25 and knn; options (num_candidates, fusion, rank_constant,
+        # rank_window_size, bm25_weight, knn_weight) override the defaults of core/config.py
         try:
             query_embedding = self.embedder.embed_text(query).embeddings
-            results = self.es_client.cosine_similarity_search(
-                index_name=self.documents_index_name, query_embedding=query_embedding, top_k=top_k)
-            results = results[:top_k]
-            es_answer_items = []
-            for item in results:
-                es_answer_item = ElasticsearchAnswerItem(
-                    index=item.get("_index", ""),
-                    id=item.get("_id", ""),
-                    score=item.get("_score", 0.0),
-                    source=item.get("_source", {}),
-                    title=item.get("_source", {}).get("doc_title", "No Title")
-                )
-                print(f"{source} RETRIEVER: document Title {es_answer_item.title} with score {es_answer_item.score}")
-                es_answer_items.append(es_answer_item)
-            es_answer = ElasticsearchAnswer(hits=es_answer_items)
-            return es_answer
+            results = self.es_client.retrieve(
+                self.documents_index_name, mode, query, query_embedding, top_k, options, projection)
+            return ElasticsearchAnswer(hits=self._to_answer_items(results, source, projection))
         except Exception as e:
             self.logger.log_interaction(f"Error during document retrieval: {e}", "error")
             return ElasticsearchAnswer(hits=[])
+
+    def retrieve_many(
+            self,
+            queries: List[str],
+            top_k: int = 5,
+            sources: Optional[List[str]] = None,
+            mode: str = RETRIEVAL_MODE,
+            options: Optional[Dict[str, Any]] = None,
+            projection: Optional[Dict[str, List[str]]] = None) -> ElasticsearchAnswer:
+        # all the queries are embedded by one encode call and searched in one _msearch,
+        # the hits are merged in query order and deduplicated on the chunk id
+        try:
+            sources = sources or ["N/A"] * len(queries)
+            vectors = self.embedder.embed_multiple_texts(queries, show_progress_bar=False).vectors
+            bodies_per_query = [
+                self.es_client.build_search_bodies(
+                    mode, query, vector.tolist(), top_k, options, projection)
+                for query, vector in zip(queries, vectors)]
+            results = self.es_client.msearch(
+                self.documents_index_name, [body for bodies in bodies_per_query for body in bodies])
+
+            merged: Dict[str, ElasticsearchAnswerItem] = {}
+            position = 0
+            for bodies, source in zip(bodies_per_query, sources):
+                query_results = results[position:position + len(bodies)]
+                position += len(bodies)
+                hits = self.es_client.merge_search_results(mode, query_results, top_k, options)
+                for item in self._to_answer_items(hits, source, projection):
+                    merged.setdefault(item.id, item)
+            return ElasticsearchAnswer(hits=list(merged.values()))
+        except Exception as e:
+            self.logger.log_interaction(f"Error during multi-query retrieval: {e}", "error")
+            return ElasticsearchAnswer(hits=[])
+
+    @staticmethod
+    def merge_answers(answers: List[ElasticsearchAnswer]) -> ElasticsearchAnswer:
+        # hits are kept in answer order, a chunk found by several queries only once
+        merged: Dict[str, ElasticsearchAnswerItem] = {}
+        for answer in answers:
+            for item in answer.hits:
+                merged.setdefault(item.id, item)
+        return ElasticsearchAnswer(hits=list(merged.values()))
+
+    def fetch_documents(
+            self,
+            document_ids: List[str],
+            projection: Optional[Dict[str, List[str]]] = None) -> List[Dict[str, Any]]:
+        # lazy access to the full _source (metadata, offsets...) of hits returned light
+        documents = self.es_client.get_documents(self.documents_index_name, document_ids, projection)
+        return [{"id": doc["_id"], **doc.get("_source", {})} for doc in documents]
+
+    def _to_answer_items(
+            self,
+            results: List[Dict[str, Any]],
+            source: str,
+            projection: Optional[Dict[str, List[str]]] = None) -> List[ElasticsearchAnswerItem]:
+        es_answer_items = []
+        for item in results:
+            item_source = item.get("_source", {})
+            es_answer_item = ElasticsearchAnswerItem(
+                index=item.get("_index", ""),
+                id=item.get("_id", ""),
+                score=item.get("_score", 0.0),
+                title=item_source.get("doc_title", "No Title"),
+                content=item_source.get("content", ""),
+                # the whole _source is only kept when the caller asked for specific fields
+                source=item_source if projection else {}
+            )
+            print(f"{source} RETRIEVER: document Title {es_answer_item.title} with score {es_answer_item.score}")
+            es_answer_items.append(es_answer_item)
+        return es_answer_items
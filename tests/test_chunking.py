@@ -0,0 +1,51 @@
+import csv
+from unittest import mock
+import pytest
+from core import preprocessing
+from core.chunking import Chunker, FALLBACK_TOKEN
+
+
+def regex_token_count(texts):
+    return [len(FALLBACK_TOKEN.findall(text)) for text in texts]
+
+
+@pytest.fixture
+def preprocessor(monkeypatch, tmp_path):
+    monkeypatch.setattr(preprocessing, "ActivityLogger", lambda source: mock.Mock())
+    preprocessor = preprocessing.Preprocessor(raw_path=str(tmp_path), clean_path=str(tmp_path))
+    preprocessor.chunker = Chunker(max_tokens=60, overlap_tokens=15, count_tokens=regex_token_count)
+    return preprocessor
+
+
+def chunk_rows(content, rows):
+    # the rows a chunk is made of, None if it holds a piece of a row
+    found = []
+    while content:
+        row = next((row for row in rows if content == row or content.startswith(row + " ")), None)
+        if row is None:
+            return None
+        found.append(row)
+        content = content[len(row):].lstrip()
+    return found
+
+
+def test_csv_row_never_spans_two_chunks(preprocessor, tmp_path):
+    # values with sentence punctuation, semicolons and blank lines, which end units in plain text
+    file_path = tmp_path / "decisions.csv"
+    with open(file_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["numero", "juridiction", "resume"])
+        for i in range(40):
+            writer.writerow([f"RG {i}", "Cour d'appel de Lyon",
+                             f"Contrat résilié le {i} mars. Voir art. {i}; pénalités dues!\n\nAppel rejeté."])
+
+    rows = [f"numero: RG {i}; juridiction: Cour d'appel de Lyon; resume: Contrat résilié le {i} mars. "
+            f"Voir art. {i}; pénalités dues! Appel rejeté." for i in range(40)]
+    chunks = list(preprocessor.iter_chunks(str(file_path)))
+    assert len(chunks) > 1
+    seen = []
+    for chunk in chunks:
+        found = chunk_rows(chunk["content"], rows)
+        assert found is not None, chunk["content"]
+        seen.extend(found)
+    assert set(seen) == set(rows)
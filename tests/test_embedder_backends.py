@@ -0,0 +1,37 @@
+# cosine parity of the quantized embedding backends with fp32 torch, skipped without the
+# optional dependencies (the model is downloaded, the onnx exports are made in MODEL_EXPORT_DIR)
+import importlib.util
+import numpy as np
+import pytest
+from core.config import EMBEDDINGS_MODEL_NAME, EMBEDDINGS_MAX_DRIFT
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("torch")
+
+TEXTS = [
+    "Le contrat est résilié de plein droit en cas d'impayé, après une mise en demeure restée sans effet.",
+    "Article 1103 du Code civil : les contrats légalement formés tiennent lieu de loi à ceux qui les ont faits.",
+    "La cour d'appel confirme le jugement et condamne la société aux dépens.",
+    "Quel est le délai de préavis pour un bail commercial ?",
+    "Les pénalités de retard sont exigibles sans qu'un rappel soit nécessaire.",
+]
+
+
+def encode(backend: str) -> np.ndarray:
+    from core.model_backends import load_embedding_model
+    vectors = load_embedding_model(EMBEDDINGS_MODEL_NAME, backend).encode(TEXTS)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope="module")
+def reference() -> np.ndarray:
+    return encode("torch")
+
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx", "onnx-int8"])
+def test_backend_parity_with_fp32(reference, backend):
+    if backend.startswith("onnx") and (importlib.util.find_spec("onnxruntime") is None
+                                       or importlib.util.find_spec("optimum") is None):
+        pytest.skip("onnx backends need optimum[onnxruntime]")
+    cosines = np.sum(encode(backend) * reference, axis=1)
+    assert 1 - cosines.min() <= EMBEDDINGS_MAX_DRIFT, f"{backend} cosine vs fp32: {cosines}"
@@ -0,0 +1,45 @@
+import copy
+from core.vector_store.mappings import DOCUMENT_INDEX_MAPPING, mapping_differences
+
+
+def live_mapping():
+    # what elasticsearch returns for an index created with DOCUMENT_INDEX_MAPPING, defaults included
+    mapping = copy.deepcopy(DOCUMENT_INDEX_MAPPING)
+    mapping["properties"]["embeddings"]["element_type"] = "float"
+    return mapping
+
+
+def test_up_to_date_mapping_has_no_differences():
+    assert mapping_differences(DOCUMENT_INDEX_MAPPING, live_mapping()) == []
+
+
+def test_dynamic_chunk_id_mapping_is_reported():
+    # index created before chunk_id was mapped: the dynamic mapping makes it an analysed text
+    mapping = live_mapping()
+    mapping["properties"]["chunk_id"] = {
+        "type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+    assert mapping_differences(DOCUMENT_INDEX_MAPPING, mapping) == ["chunk_id.type"]
+
+
+def test_missing_field_is_reported():
+    mapping = live_mapping()
+    del mapping["properties"]["chunk_index"]
+    assert mapping_differences(DOCUMENT_INDEX_MAPPING, mapping) == ["chunk_index"]
+
+
+def test_hnsw_options_change_is_reported():
+    # index built before the HNSW settings were set, or with other ones
+    expected_options = DOCUMENT_INDEX_MAPPING["properties"]["embeddings"]["index_options"]
+    mapping = live_mapping()
+    mapping["properties"]["embeddings"]["index_options"] = {**expected_options, "type": "bbq_hnsw"}
+    assert mapping_differences(DOCUMENT_INDEX_MAPPING, mapping) == ["embeddings.index_options.type"]
+    mapping["properties"]["embeddings"]["index_options"] = {**expected_options, "m": expected_options["m"] + 1}
+    assert mapping_differences(DOCUMENT_INDEX_MAPPING, mapping) == ["embeddings.index_options.m"]
+
+
+def test_standard_analyzer_is_reported():
+    # the live mapping of a text field has no analyzer key when it uses the standard analyzer
+    mapping = live_mapping()
+    mapping["properties"]["content"] = {"type": "text"}
+    mapping["properties"]["doc_title"] = {"type": "text", "analyzer": "standard"}
+    assert mapping_differences(DOCUMENT_INDEX_MAPPING, mapping) == ["doc_title.analyzer", "content.analyzer"]